@@ -0,0 +1,281 @@
+"""Batch retargeting of image directories with ``utils.resize_seam_carving``.
+
+Images are carved by a pool of worker processes, each warmed up once on
+startup so that no job pays for loading the compiled kernels. Every worker
+writes its output as soon as it is done, so results stream to disk while the
+batch runs, and only a bounded number of jobs is pending at any time. At the
+end a throughput and latency summary is printed.
+
+Jobs come either from a directory, all with the same scale factors, or from a
+CSV manifest with the columns ``path,scale_y,scale_x`` and an optional
+``masks`` column of space-separated object mask names. Images with masks are
+carved by ``SCWithObjRemoval``, the others by ``VerticalSeamImage``. Seam
+carving only removes pixels, so scale factors must be in (0, 1].
+
+Outputs keep the path of their input relative to the input directory or to the
+manifest, e.g. ``a/img.jpg`` is written to ``<out>/a/img.png``. Jobs whose
+output is already written by an earlier job of the same run fail.
+
+Examples::
+
+    # shrink every image of a directory to 80% of its height and 90% of its width
+    python batch.py --input images --scale 0.8 0.9 --out resized --workers 8
+
+    # a manifest, resuming an interrupted run, with the summary as JSON
+    python batch.py --manifest jobs.csv --out resized --skip-existing --json summary.json
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import utils
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+
+class Job(NamedTuple):
+    path: str
+    scale: Tuple[float, float]
+    masks: Tuple[str, ...] = ()
+    # the path of the output relative to the output directory, without extension
+    name: str = ""
+
+
+def _check_scale(scale: Tuple[float, float]) -> Optional[str]:
+    if not all(0 < s <= 1 for s in scale):
+        return f"expect scale factors in (0, 1], got {scale}"
+    return None
+
+
+def _get_output_name(path: str, root: str) -> str:
+    """The path of an input relative to `root`, or its absolute path if outside"""
+    name = os.path.relpath(os.path.abspath(path), root)
+    if name.startswith(os.pardir + os.sep):
+        name = os.path.abspath(path).lstrip(os.sep)
+    return os.path.splitext(name)[0]
+
+
+def _list_jobs(input_dir: str, scale: Tuple[float, float]) -> Iterator[Job]:
+    for name in sorted(os.listdir(input_dir)):
+        if name.lower().endswith(IMAGE_EXTS):
+            yield Job(
+                os.path.join(input_dir, name), scale, name=os.path.splitext(name)[0]
+            )
+
+
+def _read_manifest(manifest: str) -> Iterator[Job]:
+    """Read the jobs of a CSV manifest. Relative paths are relative to it"""
+    root = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, newline="") as f:
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            path = os.path.join(root, row["path"])
+            scale = (float(row["scale_y"]), float(row["scale_x"]))
+            error = _check_scale(scale)
+            if error is not None:
+                raise ValueError(f"{manifest}:{line}: {error}")
+            masks = tuple((row.get("masks") or "").split())
+            yield Job(path, scale, masks, _get_output_name(path, root))
+
+
+def _get_output_path(job: Job, out_dir: str) -> str:
+    return os.path.join(out_dir, f"{job.name}.png")
+
+
+def _warmup() -> None:
+    """Load the compiled kernels of ``utils`` in a fresh worker process"""
+    # a fixed file, so that it is decoded once if the image cache is enabled
+    path = os.path.join(tempfile.gettempdir(), "seam_batch_warmup.png")
+    if not os.path.exists(path):
+        rng = np.random.default_rng(0)
+        tmp_path = f"{path}.{os.getpid()}.png"
+        noise = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+        Image.fromarray(noise).save(tmp_path)
+        os.replace(tmp_path, path)
+    img = utils.VerticalSeamImage(path, vis_seams=False)
+    img.seams_removal_vertical(2)
+    img.seams_removal_horizontal(2)
+
+
+def _resize_job(job: Job, out_path: str) -> float:
+    """Carve an image in a worker process, write it and time it"""
+    start = time.perf_counter()
+    if job.masks:
+        img = utils.SCWithObjRemoval(
+            active_masks=list(job.masks), img_path=job.path, vis_seams=False
+        )
+    else:
+        img = utils.VerticalSeamImage(job.path, vis_seams=False)
+    shape = utils.scale_to_shape(img.rgb.shape[:2], job.scale)
+    dst = utils.resize_seam_carving(img, np.array([img.rgb.shape[:2], shape]))
+    dst = np.round(np.clip(dst, 0, 1) * 255).astype(np.uint8)
+    tmp_path = f"{out_path}.{os.getpid()}.png"
+    Image.fromarray(dst).save(tmp_path)
+    # an interrupted run never leaves a partial output that --skip-existing keeps
+    os.replace(tmp_path, out_path)
+    return time.perf_counter() - start
+
+
+def _summarize(latencies: List[float], failures: int, wall: float) -> Dict:
+    done = len(latencies)
+    summary = {
+        "images": done,
+        "failures": failures,
+        "seconds": wall,
+        "images_per_sec": done / wall if wall > 0 else 0.0,
+    }
+    if done:
+        for q in (50, 90, 99):
+            summary[f"latency_p{q}"] = float(np.percentile(latencies, q))
+        summary["latency_max"] = max(latencies)
+    return summary
+
+
+def run_batch(
+    jobs: Iterator[Job],
+    out_dir: str,
+    max_workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    skip_existing: bool = False,
+    log=None,
+) -> Dict:
+    """Carve a stream of jobs in a process pool, writing outputs as they complete.
+
+    :param jobs: The jobs to run. They are consumed lazily, so a manifest of any
+        length can be streamed.
+    :param out_dir: The directory to write the outputs to, as ``<job.name>.png``.
+    :param max_workers: The number of worker processes.
+    :param max_pending: The maximum number of jobs submitted and not done yet.
+        Defaults to twice the number of workers.
+    :param skip_existing: Skip jobs whose output already exists.
+    :param log: A text file to write a JSON line per finished job to.
+    :return: The throughput and latency summary. Latencies are the seconds a
+        worker spent on a job, from decoding to writing the output.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+
+    latencies = []
+    failures = 0
+    outputs = set()
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers, initializer=_warmup) as pool:
+        pending: Dict[Future, Job] = {}
+
+        def drain(block_until: int) -> None:
+            nonlocal failures
+            while len(pending) > block_until:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = pending.pop(future)
+                    record = {"path": job.path}
+                    try:
+                        record["seconds"] = future.result()
+                        latencies.append(record["seconds"])
+                    except Exception as e:
+                        failures += 1
+                        record["error"] = repr(e)
+                        print(f"FAIL {job.path}: {e!r}", file=sys.stderr)
+                    if log is not None:
+                        log.write(json.dumps(record) + "\n")
+
+        for job in jobs:
+            out_path = _get_output_path(job, out_dir)
+            if out_path in outputs:
+                # e.g. img.jpg and img.png of the same directory
+                failures += 1
+                error = f"duplicate output {out_path}"
+                print(f"FAIL {job.path}: {error}", file=sys.stderr)
+                if log is not None:
+                    log.write(json.dumps({"path": job.path, "error": error}) + "\n")
+                continue
+            outputs.add(out_path)
+            if skip_existing and os.path.exists(out_path):
+                continue
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            drain(max_pending - 1)
+            pending[pool.submit(_resize_job, job, out_path)] = job
+        drain(0)
+
+    return _summarize(latencies, failures, time.perf_counter() - start)
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="directory of the images to resize")
+    source.add_argument("--manifest", help="CSV of path,scale_y,scale_x[,masks]")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        nargs=2,
+        default=[0.9, 0.9],
+        metavar=("Y", "X"),
+        help="scale factors of the images of --input",
+    )
+    parser.add_argument("--out", required=True, help="directory of the outputs")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    parser.add_argument("--max-pending", type=int, help="bound on queued jobs")
+    parser.add_argument(
+        "--skip-existing", action="store_true", help="skip images already resized"
+    )
+    parser.add_argument("--log", help="write a JSON line per image to this file")
+    parser.add_argument("--json", help="write the summary to this file")
+    args = parser.parse_args(argv)
+    error = _check_scale(tuple(args.scale))
+    if error is not None:
+        parser.error(error)
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _parse_args(argv)
+    if args.input:
+        jobs = _list_jobs(args.input, tuple(args.scale))
+    else:
+        jobs = _read_manifest(args.manifest)
+
+    log = open(args.log, "a") if args.log else None
+    try:
+        summary = run_batch(
+            jobs, args.out, args.workers, args.max_pending, args.skip_existing, log
+        )
+    except ValueError as e:
+        # an invalid manifest row stops the run
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if log is not None:
+            log.close()
+
+    print(
+        f"{summary['images']} images in {summary['seconds']:.1f} s, "
+        f"{summary['images_per_sec']:.2f} images/s, {summary['failures']} failed"
+    )
+    if summary["images"]:
+        print(
+            "latency "
+            + " ".join(
+                f"{key[len('latency_'):]}={summary[key]:.3f}s"
+                for key in summary
+                if key.startswith("latency_")
+            )
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
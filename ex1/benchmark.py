@@ -0,0 +1,382 @@
+"""Benchmark and regression suite for ``carve.resize``.
+
+Runs a matrix of energy modes, orders, shrink and expand steps and masks on
+synthetic inputs and on the images in ``images/``, scaled to each requested
+size. For every case it reports the seams carved per second, the time spent
+per stage, the peak resident memory of the process during the case, the peak Python
+heap traced by ``tracemalloc`` (numpy buffers, but not numba's own allocations)
+and the number of numba allocations. It only needs numpy, numba and Pillow, so
+it runs headless.
+
+Examples::
+
+    # quick run, results as JSON
+    python benchmark.py --sizes 256 512 --json results.json
+
+    # record reference outputs, then check later runs against them
+    python benchmark.py --reference refs --update
+    python benchmark.py --reference refs
+
+    # fail if any case is more than 20% slower than a previous run
+    python benchmark.py --baseline results.json --tolerance 0.2
+
+The exit code is 1 if any output differs from its reference or any case is
+slower than the baseline allows.
+"""
+
+import os
+
+# numba only counts its allocations if asked to before it is imported
+os.environ.setdefault("NUMBA_NRT_STATS", "1")
+
+import argparse
+import itertools
+import json
+import resource
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from numba.core.runtime import rtsys
+from PIL import Image
+
+import carve
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+
+class Case(NamedTuple):
+    source: str
+    size: int
+    dtype: str
+    energy_mode: str
+    order: str
+    op: str
+    step_ratio: float
+    mask: str
+
+    @property
+    def name(self) -> str:
+        return (
+            f"{self.source}-{self.size}-{self.dtype}-{self.energy_mode}-{self.order}"
+            f"-{self.op}{self.step_ratio:g}-{self.mask}"
+        )
+
+
+def _synthetic_image(size: int) -> np.ndarray:
+    """A deterministic 4:3 image with smooth gradients, noise and flat blocks"""
+    h, w = size * 3 // 4, size
+    rng = np.random.default_rng(size)
+    yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+    rgb = np.stack(
+        (
+            np.sin(xx / w * 6) * 0.25 + 0.5,
+            np.cos(yy / h * 4) * 0.25 + 0.5,
+            (xx + yy) / (w + h),
+        ),
+        axis=-1,
+    )
+    rgb += rng.normal(0, 0.05, rgb.shape)
+    for _ in range(8):
+        y0, x0 = rng.integers(0, h * 3 // 4), rng.integers(0, w * 3 // 4)
+        rgb[y0 : y0 + h // 8, x0 : x0 + w // 8] = rng.random(3)
+    return np.clip(rgb, 0, 1).astype(np.float32)
+
+
+def _load_image(path: str, size: int) -> np.ndarray:
+    """Load an image, scaled so that its longer side is `size` pixels"""
+    img = Image.open(path).convert("RGB")
+    scale = size / max(img.size)
+    img = img.resize(
+        (max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+        Image.BICUBIC,
+    )
+    return np.asarray(img, dtype=np.float32) / 255
+
+
+def _list_images() -> List[str]:
+    if not os.path.isdir(IMAGE_DIR):
+        return []
+    return sorted(
+        os.path.join(IMAGE_DIR, name)
+        for name in os.listdir(IMAGE_DIR)
+        if name.lower().endswith(IMAGE_EXTS)
+    )
+
+
+def _get_masks(shape: Tuple[int, int], mask: str) -> Dict[str, np.ndarray]:
+    """Build the keep or drop mask of a case"""
+    h, w = shape
+    if mask == "none":
+        return {}
+    yy, xx = np.mgrid[0:h, 0:w]
+    if mask == "keep":
+        # an ellipse in the middle of the image
+        ellipse = ((yy - h / 2) / (h / 4)) ** 2 + ((xx - w / 2) / (w / 6)) ** 2 <= 1
+        return {"keep_mask": ellipse}
+    # a small object left of the center
+    drop_mask = np.zeros((h, w), dtype=bool)
+    drop_mask[h * 2 // 5 : h * 3 // 5, w // 3 : w // 3 + max(1, w // 20)] = True
+    return {"drop_mask": drop_mask}
+
+
+def _get_target(
+    case: Case, shape: Tuple[int, int], ratio: float
+) -> Optional[Tuple[int, int]]:
+    if case.mask == "drop":
+        # only remove the object
+        return None
+    h, w = shape
+    dw = max(1, round(w * ratio))
+    dh = max(1, round(h * ratio))
+    if case.op == "shrink":
+        return w - dw, h - dh
+    return w + dw, h + dh
+
+
+def _build_cases(args: argparse.Namespace) -> List[Case]:
+    sources = ["synthetic"] + [
+        os.path.splitext(os.path.basename(path))[0] for path in _list_images()
+    ]
+    if args.sources:
+        sources = [src for src in sources if src in args.sources]
+    cases = []
+    for source, size, energy_mode, order in itertools.product(
+        sources, args.sizes, args.energy_modes, args.orders
+    ):
+        # the dtype is part of the case name, so that the references and the
+        # baseline of uint8 and float32 runs do not collide
+        base = (source, size, args.dtype, energy_mode, order)
+        cases.append(Case(*base, "shrink", 0.5, "none"))
+        for step_ratio in args.step_ratios:
+            cases.append(Case(*base, "expand", step_ratio, "none"))
+        if not args.no_masks:
+            cases.append(Case(*base, "shrink", 0.5, "keep"))
+            cases.append(Case(*base, "shrink", 0.5, "drop"))
+    return cases
+
+
+def _get_peak_rss() -> int:
+    """The peak resident bytes of the process.
+
+    On Linux the peak is reset by ``_reset_peak_rss``, elsewhere it is the peak
+    since the process started.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            status = dict(line.split(":", 1) for line in f)
+        return int(status["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError):
+        # ru_maxrss is in KB on Linux, in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _reset_peak_rss() -> None:
+    """Reset the peak to the current resident bytes, on Linux only"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _get_input(source: str, size: int, dtype: np.dtype, cache: Dict) -> np.ndarray:
+    key = (source, size, dtype)
+    if key not in cache:
+        if source == "synthetic":
+            src = _synthetic_image(size)
+        else:
+            path = next(
+                p
+                for p in _list_images()
+                if os.path.splitext(os.path.basename(p))[0] == source
+            )
+            src = _load_image(path, size)
+        if dtype == np.uint8:
+            src = np.round(src * 255).astype(np.uint8)
+        cache[key] = src
+    return cache[key]
+
+
+def _run_case(
+    case: Case, src: np.ndarray, ratio: float, repeat: int
+) -> Tuple[np.ndarray, Dict]:
+    """Run a case once to warm up, `repeat` times for timing and once traced"""
+    target = _get_target(case, src.shape[:2], ratio)
+    masks = _get_masks(src.shape[:2], case.mask)
+    kwargs = dict(
+        size=target,
+        energy_mode=case.energy_mode,
+        order=case.order,
+        step_ratio=case.step_ratio,
+        **masks,
+    )
+
+    # compile the kernels of this configuration on a subsampled copy
+    stride = max(1, max(src.shape[:2]) // 32)
+    tiny = np.ascontiguousarray(src[::stride, ::stride])
+    tiny_kwargs = dict(kwargs, size=_get_target(case, tiny.shape[:2], ratio))
+    for key, mask in masks.items():
+        tiny_kwargs[key] = np.ascontiguousarray(mask[::stride, ::stride])
+    carve.resize(tiny, **tiny_kwargs)
+
+    _reset_peak_rss()
+    best = None
+    for _ in range(repeat):
+        reports: List[carve.CarveProgress] = []
+        start = time.perf_counter()
+        dst = carve.resize(src, progress_callback=reports.append, **kwargs)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, reports[-1] if reports else None)
+    rss_peak = _get_peak_rss()
+    elapsed, last = best
+    seams = last.seams_done if last is not None else 0
+    stage_times = last.stage_times if last is not None else {}
+
+    allocs_before = rtsys.get_allocation_stats().alloc
+    tracemalloc.start()
+    carve.resize(src, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    nrt_allocs = rtsys.get_allocation_stats().alloc - allocs_before
+
+    result = {
+        "case": case.name,
+        "shape": list(src.shape),
+        "target": list(target) if target is not None else None,
+        "seams": seams,
+        "seconds": elapsed,
+        "seams_per_sec": seams / elapsed if elapsed > 0 else 0.0,
+        "stage_times": stage_times,
+        "rss_peak_mb": rss_peak / 2**20,
+        "py_peak_mb": peak / 2**20,
+        "nrt_allocs": nrt_allocs,
+    }
+    return dst, result
+
+
+def _check_reference(
+    dst: np.ndarray, case: Case, reference: str, update: bool
+) -> Optional[str]:
+    """Compare the output with the saved one, or save it. Return an error if any"""
+    path = os.path.join(reference, f"{case.name}.npy")
+    if update or not os.path.exists(path):
+        os.makedirs(reference, exist_ok=True)
+        np.save(path, dst)
+        return None
+    expected = np.load(path)
+    if expected.shape != dst.shape:
+        return f"shape {dst.shape} != reference {expected.shape}"
+    if not np.array_equal(expected, dst):
+        diff = np.abs(expected.astype(np.float64) - dst.astype(np.float64))
+        return f"{np.count_nonzero(diff)} values differ, max diff {diff.max():g}"
+    return None
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[256, 512, 1024],
+        help="longer side of the inputs in pixels, e.g. 256 1024 4096 7680",
+    )
+    parser.add_argument(
+        "--sources",
+        nargs="+",
+        help="inputs to run: 'synthetic' and/or image names from images/",
+    )
+    parser.add_argument("--energy-modes", nargs="+", default=["backward", "forward"])
+    parser.add_argument("--orders", nargs="+", default=["width-first", "height-first"])
+    parser.add_argument(
+        "--step-ratios",
+        type=float,
+        nargs="+",
+        default=[0.5, 0.05],
+        help="step ratios of the expand cases",
+    )
+    parser.add_argument(
+        "--ratio",
+        type=float,
+        default=0.1,
+        help="fraction of each side to remove or insert",
+    )
+    parser.add_argument("--dtype", choices=["float32", "uint8"], default="float32")
+    parser.add_argument("--no-masks", action="store_true", help="skip mask cases")
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="timed runs per case, the best is kept"
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--reference", help="directory of reference outputs")
+    parser.add_argument(
+        "--update", action="store_true", help="overwrite the reference outputs"
+    )
+    parser.add_argument("--baseline", help="results of a previous run to compare to")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed relative slowdown against the baseline",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = _parse_args(argv)
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {res["case"]: res for res in json.load(f)["results"]}
+
+    carve.warmup(tuple(args.energy_modes), (np.dtype(args.dtype),))
+    inputs = {}
+    results = []
+    failures = []
+    print(
+        f"{'case':<64} {'seams':>6} {'sec':>8} {'seams/s':>9} "
+        f"{'rss MB':>8} {'heap MB':>8} {'allocs':>8}"
+    )
+    for case in _build_cases(args):
+        src = _get_input(case.source, case.size, np.dtype(case.dtype), inputs)
+        dst, result = _run_case(case, src, args.ratio, args.repeat)
+        results.append(result)
+        status = ""
+
+        if args.reference:
+            error = _check_reference(dst, case, args.reference, args.update)
+            if error is not None:
+                failures.append(f"{case.name}: output mismatch, {error}")
+                status = " MISMATCH"
+
+        prev = baseline.get(case.name)
+        if prev is not None and prev["seams_per_sec"] > 0:
+            ratio = result["seams_per_sec"] / prev["seams_per_sec"]
+            if ratio < 1 - args.tolerance:
+                failures.append(f"{case.name}: {ratio:.2f}x the baseline speed")
+                status += " SLOWER"
+
+        print(
+            f"{case.name:<64} {result['seams']:>6} {result['seconds']:>8.3f} "
+            f"{result['seams_per_sec']:>9.1f} {result['rss_peak_mb']:>8.1f} "
+            f"{result['py_peak_mb']:>8.1f} "
+            f"{result['nrt_allocs']:>8}{status}",
+            flush=True,
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,17 @@
+import time
+
+# `warmup` reports the import time of numba and this module from here
+_IMPORT_START = time.perf_counter()
+
+import multiprocessing
+import os
+import tempfile
 import warnings
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
 from enum import Enum
-from typing import Optional, Tuple
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import numba as nb
 import numpy as np
@@ -9,9 +20,39 @@ DROP_MASK_ENERGY = 1e5
 KEEP_MASK_ENERGY = 1e3
 
 
+def _get_u8_energy_tables() -> Tuple[np.ndarray, np.ndarray]:
+    """Code each squared gradient magnitude of an 8-bit map, and decode it to float32.
+
+    There are fewer than 2 ** 15 distinct sums gy ** 2 + gx ** 2 of 8-bit
+    gradients, so 8-bit energy maps are stored as int16 codes. Codes decode to
+    the same float32 square roots as float maps, so both sum the same energies.
+    """
+    squares = np.arange(256) ** 2
+    magnitudes = np.unique(squares[:, None] + squares[None, :])
+    codes = np.zeros(magnitudes[-1] + 1, dtype=np.int16)
+    codes[magnitudes] = np.arange(len(magnitudes))
+    return codes, np.sqrt(magnitudes.astype(np.float32))
+
+
+U8_ENERGY_CODES, U8_ENERGY_VALUES = _get_u8_energy_tables()
+
+# Kernels are compiled on first use and cached on disk by numba. If this environment
+# variable is set, the cache is pinned to that directory, so it can be prepopulated
+# by `warmup` and shipped along with this file.
+CACHE_DIR_ENV = "CARVE_CACHE_DIR"
+if os.environ.get(CACHE_DIR_ENV):
+    nb.config.CACHE_DIR = os.environ[CACHE_DIR_ENV]
+
+
+OPTIMAL_ORDER_PROXY_SIZE = 64
+# seams removing an object stay within this many columns of its bounding box
+OBJECT_MARGIN = 32
+
+
 class OrderMode(str, Enum):
     WIDTH_FIRST = "width-first"
     HEIGHT_FIRST = "height-first"
+    OPTIMAL = "optimal"
 
 
 class EnergyMode(str, Enum):
@@ -23,87 +64,288 @@ def _list_enum(enum_class) -> Tuple:
     return tuple(x.value for x in enum_class)
 
 
+class CarveProgress(NamedTuple):
+    """A progress report passed to the ``progress_callback`` of ``resize``"""
+
+    seams_done: int
+    seams_total: int
+    # wall-clock seconds since ``resize`` started
+    elapsed: float
+    # seconds spent per stage: energy, dp, backtrack, removal and insertion
+    stage_times: Dict[str, float]
+    # bytes held by the working buffers of the current seam batch
+    buffer_bytes: int
+
+
+class CarveCancelled(Exception):
+    """Raised by ``resize`` when its progress callback requests cancellation"""
+
+
+class _ProgressTracker:
+    """Accumulate the time spent per stage and report progress to a callback"""
+
+    STAGES = ("energy", "dp", "backtrack", "removal", "insertion")
+
+    def __init__(self, callback: Callable[[CarveProgress], Optional[bool]]) -> None:
+        self.callback = callback
+        self.seams_done = 0
+        self.seams_total = 0
+        self.stage_times = dict.fromkeys(self.STAGES, 0.0)
+        self.start = self.last = time.perf_counter()
+
+    def expect(self, num_seams: int) -> None:
+        """Set the number of seams still to be carved"""
+        self.seams_total = self.seams_done + num_seams
+
+    def lap(self, stage: str) -> None:
+        """Charge the time since the previous lap to the given stage"""
+        now = time.perf_counter()
+        self.stage_times[stage] += now - self.last
+        self.last = now
+
+    def update(self, num_seams: int, *buffers: Optional[np.ndarray]) -> None:
+        """Count finished seams, invoke the callback and honor cancellation"""
+        self.seams_done += num_seams
+        self.seams_total = max(self.seams_total, self.seams_done)
+        progress = CarveProgress(
+            self.seams_done,
+            self.seams_total,
+            time.perf_counter() - self.start,
+            dict(self.stage_times),
+            sum(buf.nbytes for buf in buffers if buf is not None),
+        )
+        if self.callback(progress):
+            raise CarveCancelled(
+                f"cancelled after {self.seams_done} of {self.seams_total} seams"
+            )
+        # the time spent in the callback is not charged to any stage
+        self.last = time.perf_counter()
+
+
+# The tracker of the running ``resize`` call, or None if no callback is installed
+_TRACKER: ContextVar[Optional[_ProgressTracker]] = ContextVar("_TRACKER", default=None)
+
+
+@contextmanager
+def _track_progress(
+    callback: Optional[Callable[[CarveProgress], Optional[bool]]],
+) -> Iterator[Optional[_ProgressTracker]]:
+    """Install a progress tracker for the current context if a callback is given"""
+    tracker = None if callback is None else _ProgressTracker(callback)
+    token = _TRACKER.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _TRACKER.reset(token)
+
+
+@contextmanager
+def _numba_threads(num_threads: Optional[int]) -> Iterator[None]:
+    """Temporarily set the number of threads used by the parallel numba kernels"""
+    if num_threads is None:
+        yield
+        return
+    prev_threads = nb.get_num_threads()
+    nb.set_num_threads(num_threads)
+    try:
+        yield
+    finally:
+        nb.set_num_threads(prev_threads)
+
+
+@nb.njit(parallel=True, cache=True)
+def _rgb2gray_kernel_u8(rgb: np.ndarray) -> np.ndarray:
+    """The numba kernel for converting an 8-bit RGB image to grayscale"""
+    h, w, _ = rgb.shape
+    gray = np.empty((h, w), dtype=np.uint8)
+    for r in nb.prange(h):
+        for c in range(w):
+            # fixed-point weights in 1/10000 units, matching the float coefficients
+            gray[r, c] = (
+                2125 * np.int32(rgb[r, c, 0])
+                + 7154 * np.int32(rgb[r, c, 1])
+                + 721 * np.int32(rgb[r, c, 2])
+            ) // 10000
+    return gray
+
+
 def _rgb2gray(rgb: np.ndarray) -> np.ndarray:
     """Convert an RGB image to a grayscale image"""
+    if rgb.dtype == np.uint8:
+        return _rgb2gray_kernel_u8(rgb)
     coeffs = np.array([0.2125, 0.7154, 0.0721], dtype=np.float32)
     return (rgb @ coeffs).astype(rgb.dtype)
 
 
+def _get_idx_map(h: int, w: int) -> np.ndarray:
+    """Map each pixel to its source column, using the narrowest integer type"""
+    dtype = np.int16 if w <= np.iinfo(np.int16).max else np.int32
+    return np.broadcast_to(np.arange(w, dtype=dtype), (h, w))
+
+
+def _get_seam_map(h: int, w: int, labeled: bool) -> np.ndarray:
+    """An empty map of the seams found in source coordinates.
+
+    A mask, or if labeled, the 1-based order in which each seam was found.
+    """
+    return np.zeros((h, w), dtype=np.int32 if labeled else bool)
+
+
 def _get_seam_mask(src: np.ndarray, seam: np.ndarray) -> np.ndarray:
     """Convert a list of seam column indices to a mask"""
-    return np.eye(src.shape[1], dtype=bool)[seam]
+    seam_mask = np.zeros(src.shape[:2], dtype=bool)
+    seam_mask[np.arange(len(seam)), seam] = True
+    return seam_mask
 
 
 def _remove_seam_mask(src: np.ndarray, seam_mask: np.ndarray) -> np.ndarray:
-    """Remove a seam from the source image according to the given seam_mask"""
+    """Remove one or more seams from the source image according to the given seam_mask"""
     if src.ndim == 3:
         h, w, c = src.shape
         seam_mask = np.broadcast_to(seam_mask[:, :, None], src.shape)
-        dst = src[~seam_mask].reshape((h, w - 1, c))
+        dst = src[~seam_mask].reshape((h, -1, c))
     else:
         h, w = src.shape
-        dst = src[~seam_mask].reshape((h, w - 1))
+        dst = src[~seam_mask].reshape((h, -1))
     return dst
 
 
+@nb.njit(parallel=True, cache=True)
+def _get_energy_kernel(gray: np.ndarray) -> np.ndarray:
+    """The numba kernel for computing the backward energy map"""
+    h, w = gray.shape
+    energy = np.empty((h, w), dtype=np.float32)
+    for r in nb.prange(h):
+        # replicate the last row and column so the gradient vanishes at the border
+        below = min(r + 1, h - 1)
+        for c in range(w):
+            gradient_y = gray[r, c] - gray[below, c]
+            gradient_x = gray[r, c] - gray[r, min(c + 1, w - 1)]
+            energy[r, c] = np.sqrt(gradient_y * gradient_y + gradient_x * gradient_x)
+    return energy
+
+
+@nb.njit(parallel=True, cache=True)
+def _get_energy_kernel_u8(gray: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """The numba kernel for computing the coded backward energy map of an 8-bit image"""
+    h, w = gray.shape
+    energy = np.empty((h, w), dtype=np.int16)
+    for r in nb.prange(h):
+        below = min(r + 1, h - 1)
+        for c in range(w):
+            gradient_y = np.int32(gray[r, c]) - np.int32(gray[below, c])
+            gradient_x = np.int32(gray[r, c]) - np.int32(gray[r, min(c + 1, w - 1)])
+            energy[r, c] = codes[gradient_y * gradient_y + gradient_x * gradient_x]
+    return energy
+
+
 def _get_energy(gray: np.ndarray) -> np.ndarray:
     """Get backward energy map from the source image"""
-    h, w = gray.shape
-    gradient_magnitude = np.ndarray((h, w))
+    if gray.dtype == np.uint8:
+        return _get_energy_kernel_u8(gray, U8_ENERGY_CODES)
+    return _get_energy_kernel(np.asarray(gray, dtype=np.float32))
 
-    for i in range(h):
-        for j in range(w):
-            gradient_y = gray[i, j] - gray[i + 1, j]
-            gradient_x = gray[i, j] - gray[i, j + 1]
-            gradient_magnitude[i, j] = np.sqrt(gradient_y * gradient_y + gradient_x * gradient_x)
 
-    return gradient_magnitude
+def _get_energy_values(energy: np.ndarray) -> Optional[np.ndarray]:
+    """The table decoding a coded 8-bit energy map, or None for a float32 map"""
+    return U8_ENERGY_VALUES if energy.dtype == np.int16 else None
 
 
-@nb.njit(nb.int32[:](nb.float32[:, :]), cache=True)
-def _get_backward_seam(energy: np.ndarray) -> np.ndarray:
-    """Compute the minimum vertical seam from the backward energy map"""
+def _add_aux_energy(energy: np.ndarray, aux_energy: np.ndarray) -> np.ndarray:
+    """Add the auxiliary energy to an energy map, decoding coded maps to float32"""
+    if energy.dtype == np.float32:
+        energy += aux_energy
+        return energy
+    return U8_ENERGY_VALUES[energy] + aux_energy
+
+
+@nb.njit(cache=True)
+def _backtrack_seam(parent: np.ndarray, col: int) -> np.ndarray:
+    """Backtrack a vertical seam ending at the given column of the bottom row.
+
+    The parent map holds the column offset (-1, 0 or 1) to the previous row.
+    """
+    h, _ = parent.shape
+    seam = np.empty(h, dtype=np.int32)
+    for r in range(h - 1, -1, -1):
+        seam[r] = col
+        col += parent[r, col]
+    return seam
+
+
+@nb.njit(cache=True)
+def _get_energy_row(
+    energy: np.ndarray, values: Optional[np.ndarray], r: int
+) -> np.ndarray:
+    """A row of an energy map in float32, decoded if `values` is given"""
+    if values is None:
+        return energy[r].astype(np.float32)
+    return values[energy[r]]
+
+
+@nb.njit(cache=True)
+def _get_backward_cost(
+    energy: np.ndarray, values: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the parent map and the bottom-row cumulative cost from the backward energy map.
+
+    A coded 8-bit energy map is decoded a row at a time by the `values` table.
+    """
     h, w = energy.shape
     inf = np.array([np.inf], dtype=np.float32)
-    cost = np.concatenate((inf, energy[0], inf))
-    parent = np.empty((h, w), dtype=np.int32)
+    cost = np.concatenate((inf, _get_energy_row(energy, values, 0), inf))
+    parent = np.empty((h, w), dtype=np.int8)
     base_idx = np.arange(-1, w - 1, dtype=np.int32)
 
     for r in range(1, h):
         choices = np.vstack((cost[:-2], cost[1:-1], cost[2:]))
-        min_idx = np.argmin(choices, axis=0) + base_idx
-        parent[r] = min_idx
-        cost[1:-1] = cost[1:-1][min_idx] + energy[r]
+        min_idx = np.argmin(choices, axis=0)
+        parent[r] = min_idx - 1
+        cost[1:-1] = cost[1:-1][min_idx + base_idx] + _get_energy_row(energy, values, r)
 
-    c = np.argmin(cost[1:-1])
-    seam = np.empty(h, dtype=np.int32)
-    for r in range(h - 1, -1, -1):
-        seam[r] = c
-        c = parent[r, c]
+    return parent, cost[1:-1]
 
-    return seam
+
+@nb.njit(cache=True)
+def _get_backward_seam(energy: np.ndarray) -> np.ndarray:
+    """Compute the minimum vertical seam from the backward energy map"""
+    parent, cost = _get_backward_cost(energy)
+    return _backtrack_seam(parent, np.int32(np.argmin(cost)))
 
 
 def _get_backward_seams(
-    gray: np.ndarray, num_seams: int, aux_energy: Optional[np.ndarray]
+    gray: np.ndarray,
+    num_seams: int,
+    aux_energy: Optional[np.ndarray],
+    labeled: bool = False,
 ) -> np.ndarray:
     """Compute the minimum N vertical seams using backward energy"""
     h, w = gray.shape
-    seams = np.zeros((h, w), dtype=bool)
+    seams = _get_seam_map(h, w, labeled)
     rows = np.arange(h, dtype=np.int32)
-    idx_map = np.broadcast_to(np.arange(w, dtype=np.int32), (h, w))
+    idx_map = _get_idx_map(h, w)
+    tracker = _TRACKER.get()
     energy = _get_energy(gray)
     if aux_energy is not None:
-        energy += aux_energy
-    for _ in range(num_seams):
-        seam = _get_backward_seam(energy)
-        seams[rows, idx_map[rows, seam]] = True
+        energy = _add_aux_energy(energy, aux_energy)
+    if tracker is not None:
+        tracker.lap("energy")
+    for i in range(num_seams):
+        parent, cost = _get_backward_cost(energy, _get_energy_values(energy))
+        if tracker is not None:
+            tracker.lap("dp")
+        seam = _backtrack_seam(parent, np.int32(np.argmin(cost)))
+        seams[rows, idx_map[rows, seam]] = i + 1
+        if tracker is not None:
+            tracker.lap("backtrack")
 
         seam_mask = _get_seam_mask(gray, seam)
         gray = _remove_seam_mask(gray, seam_mask)
         idx_map = _remove_seam_mask(idx_map, seam_mask)
         if aux_energy is not None:
             aux_energy = _remove_seam_mask(aux_energy, seam_mask)
+        if tracker is not None:
+            tracker.lap("removal")
 
         # Only need to re-compute the energy in the bounding box of the seam
         _, cur_w = energy.shape
@@ -115,40 +357,42 @@ def _get_backward_seams(
         _, mid_w = mid_block.shape
         mid_energy = _get_energy(mid_block)[:, pad_lo : mid_w - pad_hi]
         if aux_energy is not None:
-            mid_energy += aux_energy[:, lo:hi]
+            mid_energy = _add_aux_energy(mid_energy, aux_energy[:, lo:hi])
         energy = np.hstack((energy[:, :lo], mid_energy, energy[:, hi + 1 :]))
+        if tracker is not None:
+            tracker.lap("energy")
+            tracker.update(1, gray, idx_map, aux_energy, energy, parent, seams)
 
     return seams
 
 
-@nb.njit(
-    [
-        nb.int32[:](nb.float32[:, :], nb.none),
-        nb.int32[:](nb.float32[:, :], nb.float32[:, :]),
-    ],
-    cache=True,
-)
-def _get_forward_seam(gray: np.ndarray, aux_energy: Optional[np.ndarray]) -> np.ndarray:
-    """Compute the minimum vertical seam using forward energy"""
+@nb.njit(cache=True)
+def _get_forward_cost(
+    gray: np.ndarray, aux_energy: Optional[np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the parent map and the bottom-row cumulative cost using forward energy"""
     h, w = gray.shape
 
     gray = np.hstack((gray[:, :1], gray, gray[:, -1:]))
 
+    # rows are promoted to float32 one at a time, so 8-bit maps are never copied whole
+    curr = gray[0].astype(np.float32)
     inf = np.array([np.inf], dtype=np.float32)
-    dp = np.concatenate((inf, np.abs(gray[0, 2:] - gray[0, :-2]), inf))
+    dp = np.concatenate((inf, np.abs(curr[2:] - curr[:-2]), inf))
 
-    parent = np.empty((h, w), dtype=np.int32)
-    base_idx = np.arange(-1, w - 1, dtype=np.int32)
+    parent = np.empty((h, w), dtype=np.int8)
 
     inf = np.array([np.inf], dtype=np.float32)
     for r in range(1, h):
-        curr_shl = gray[r, 2:]
-        curr_shr = gray[r, :-2]
+        prev = curr
+        curr = gray[r].astype(np.float32)
+        curr_shl = curr[2:]
+        curr_shr = curr[:-2]
         cost_mid = np.abs(curr_shl - curr_shr)
         if aux_energy is not None:
             cost_mid += aux_energy[r]
 
-        prev_mid = gray[r - 1, 1:-1]
+        prev_mid = prev[1:-1]
         cost_left = cost_mid + np.abs(prev_mid - curr_shr)
         cost_right = cost_mid + np.abs(prev_mid - curr_shl)
 
@@ -160,50 +404,314 @@ def _get_forward_seam(gray: np.ndarray, aux_energy: Optional[np.ndarray]) -> np.
             (cost_left + dp_left, cost_mid + dp_mid, cost_right + dp_right)
         )
         min_idx = np.argmin(choices, axis=0)
-        parent[r] = min_idx + base_idx
+        parent[r] = min_idx - 1
         # numba does not support specifying axis in np.min, below loop is equivalent to:
         # `dp_mid[:] = np.min(choices, axis=0)` or `dp_mid[:] = choices[min_idx, np.arange(w)]`
         for j, i in enumerate(min_idx):
             dp_mid[j] = choices[i, j]
 
-    c = np.argmin(dp[1:-1])
-    seam = np.empty(h, dtype=np.int32)
-    for r in range(h - 1, -1, -1):
-        seam[r] = c
-        c = parent[r, c]
+    return parent, dp[1:-1]
 
-    return seam
+
+@nb.njit(cache=True)
+def _get_forward_seam(gray: np.ndarray, aux_energy: Optional[np.ndarray]) -> np.ndarray:
+    """Compute the minimum vertical seam using forward energy"""
+    parent, cost = _get_forward_cost(gray, aux_energy)
+    return _backtrack_seam(parent, np.int32(np.argmin(cost)))
 
 
 def _get_forward_seams(
-    gray: np.ndarray, num_seams: int, aux_energy: Optional[np.ndarray]
+    gray: np.ndarray,
+    num_seams: int,
+    aux_energy: Optional[np.ndarray],
+    labeled: bool = False,
 ) -> np.ndarray:
     """Compute minimum N vertical seams using forward energy"""
     h, w = gray.shape
-    seams = np.zeros((h, w), dtype=bool)
+    seams = _get_seam_map(h, w, labeled)
     rows = np.arange(h, dtype=np.int32)
-    idx_map = np.broadcast_to(np.arange(w, dtype=np.int32), (h, w))
-    for _ in range(num_seams):
-        seam = _get_forward_seam(gray, aux_energy)
-        seams[rows, idx_map[rows, seam]] = True
+    idx_map = _get_idx_map(h, w)
+    tracker = _TRACKER.get()
+    for i in range(num_seams):
+        # the forward energy is computed within the DP
+        parent, cost = _get_forward_cost(gray, aux_energy)
+        if tracker is not None:
+            tracker.lap("dp")
+        seam = _backtrack_seam(parent, np.int32(np.argmin(cost)))
+        seams[rows, idx_map[rows, seam]] = i + 1
+        if tracker is not None:
+            tracker.lap("backtrack")
         seam_mask = _get_seam_mask(gray, seam)
         gray = _remove_seam_mask(gray, seam_mask)
         idx_map = _remove_seam_mask(idx_map, seam_mask)
         if aux_energy is not None:
             aux_energy = _remove_seam_mask(aux_energy, seam_mask)
+        if tracker is not None:
+            tracker.lap("removal")
+            tracker.update(1, gray, idx_map, aux_energy, parent, seams)
+
+    return seams
+
+
+@nb.njit(cache=True)
+def _get_multi_seams_kernel(
+    parent: np.ndarray, cost: np.ndarray, max_seams: int
+) -> np.ndarray:
+    """Backtrack up to max_seams non-overlapping seams from the cheapest bottom-row entries"""
+    h, w = parent.shape
+    taken = np.zeros((h, w), dtype=np.bool_)
+    seams = np.empty((max_seams, h), dtype=np.int32)
+    num_seams = 0
+    for col in np.argsort(cost):
+        if num_seams == max_seams:
+            break
+        seam = _backtrack_seam(parent, np.int32(col))
+        collide = False
+        for r in range(h):
+            if taken[r, seam[r]]:
+                collide = True
+                break
+        if collide:
+            continue
+        for r in range(h):
+            taken[r, seam[r]] = True
+        seams[num_seams] = seam
+        num_seams += 1
+    return seams[:num_seams]
+
+
+def _get_multi_seams(
+    gray: np.ndarray,
+    num_seams: int,
+    energy_mode: str,
+    aux_energy: Optional[np.ndarray],
+    seams_per_pass: int,
+    labeled: bool = False,
+) -> np.ndarray:
+    """Compute N vertical seams, extracting several seams from each cumulative-cost pass"""
+    h, w = gray.shape
+    seams = _get_seam_map(h, w, labeled)
+    rows = np.arange(h, dtype=np.int32)[:, None]
+    idx_map = _get_idx_map(h, w)
+    tracker = _TRACKER.get()
+    found = 0
+    while num_seams > 0:
+        if energy_mode == EnergyMode.BACKWARD:
+            energy = _get_energy(gray)
+            if aux_energy is not None:
+                energy += aux_energy
+            if tracker is not None:
+                tracker.lap("energy")
+            parent, cost = _get_backward_cost(energy)
+        else:
+            parent, cost = _get_forward_cost(gray, aux_energy)
+        if tracker is not None:
+            tracker.lap("dp")
+
+        batch = _get_multi_seams_kernel(parent, cost, min(seams_per_pass, num_seams)).T
+        # the seams of a pass are ordered by cost
+        seams[rows, idx_map[rows, batch]] = found + 1 + np.arange(batch.shape[1])
+        if tracker is not None:
+            tracker.lap("backtrack")
+
+        seam_mask = np.zeros(gray.shape, dtype=bool)
+        seam_mask[rows, batch] = True
+        gray = _remove_seam_mask(gray, seam_mask)
+        idx_map = _remove_seam_mask(idx_map, seam_mask)
+        if aux_energy is not None:
+            aux_energy = _remove_seam_mask(aux_energy, seam_mask)
+        num_seams -= batch.shape[1]
+        found += batch.shape[1]
+        if tracker is not None:
+            tracker.lap("removal")
+            tracker.update(batch.shape[1], gray, idx_map, aux_energy, parent, seams)
+
+    return seams
+
+
+@nb.njit(cache=True)
+def _get_band_seam(
+    gray: np.ndarray,
+    aux_energy: Optional[np.ndarray],
+    lo: np.ndarray,
+    hi: np.ndarray,
+    forward: bool,
+) -> np.ndarray:
+    """Compute the minimum vertical seam restricted to columns [lo[r], hi[r]) of each row"""
+    h, w = gray.shape
+    band_w = np.max(hi - lo)
+    prev_cost = np.full(band_w, np.inf, dtype=np.float32)
+    cost = np.full(band_w, np.inf, dtype=np.float32)
+    parent = np.zeros((h, band_w), dtype=np.int32)
+
+    for r in range(h):
+        for j in range(lo[r], hi[r]):
+            left = gray[r, max(j - 1, 0)]
+            right = gray[r, min(j + 1, w - 1)]
+            if forward:
+                cost_mid = np.abs(right - left)
+            else:
+                grad_y = gray[r, j] - gray[min(r + 1, h - 1), j]
+                grad_x = gray[r, j] - right
+                cost_mid = np.sqrt(grad_y * grad_y + grad_x * grad_x)
+            if aux_energy is not None:
+                cost_mid += aux_energy[r, j]
+
+            if r == 0:
+                cost[j - lo[r]] = cost_mid
+                continue
+
+            best = np.inf
+            best_col = j
+            for dc in range(-1, 2):
+                pc = j + dc
+                if pc < lo[r - 1] or pc >= hi[r - 1]:
+                    continue
+                step = cost_mid
+                if forward and dc != 0:
+                    step += np.abs(gray[r - 1, j] - (left if dc < 0 else right))
+                c = prev_cost[pc - lo[r - 1]] + step
+                if c < best:
+                    best = c
+                    best_col = pc
+            cost[j - lo[r]] = best
+            parent[r, j - lo[r]] = best_col
+
+        prev_cost, cost = cost, prev_cost
+        cost[:] = np.inf
+
+    n = hi[h - 1] - lo[h - 1]
+    col = lo[h - 1] + np.argmin(prev_cost[:n])
+    seam = np.empty(h, dtype=np.int32)
+    for r in range(h - 1, -1, -1):
+        seam[r] = col
+        col = parent[r, col - lo[r]]
+    return seam
+
+
+def _pyr_down(src: np.ndarray) -> np.ndarray:
+    """Blur a 2d map with a 5-tap Gaussian kernel and downsample it by a factor of 2"""
+    kernel = np.array([1, 4, 6, 4, 1], dtype=np.float32) / 16
+    h, w = src.shape
+    pad = np.pad(src, 2, mode="edge")
+    tmp = sum(k * pad[i : i + h] for i, k in enumerate(kernel))
+    dst = sum(k * tmp[:, i : i + w] for i, k in enumerate(kernel))
+    return dst[::2, ::2].astype(np.float32)
+
+
+def _get_pyramid_seams(
+    gray: np.ndarray,
+    num_seams: int,
+    energy_mode: str,
+    aux_energy: Optional[np.ndarray],
+    pyramid_levels: int,
+    band_width: int,
+    labeled: bool = False,
+) -> np.ndarray:
+    """Compute N vertical seams coarse-to-fine on a Gaussian pyramid"""
+    h, w = gray.shape
+    seams = _get_seam_map(h, w, labeled)
+    rows = np.arange(h, dtype=np.int32)
+    idx_map = _get_idx_map(h, w)
+    tracker = _TRACKER.get()
+
+    coarse = gray
+    coarse_aux = aux_energy
+    for _ in range(pyramid_levels):
+        coarse = _pyr_down(coarse)
+        if coarse_aux is not None:
+            coarse_aux = _pyr_down(coarse_aux)
+    if tracker is not None:
+        tracker.lap("energy")
+    scale = 2**pyramid_levels
+    coarse_rows = np.minimum(rows // scale, coarse.shape[0] - 1)
+    # the band must cover the jump of the upsampled path between coarse rows
+    band_width = max(band_width, scale)
+    forward = energy_mode == EnergyMode.FORWARD
+
+    found = 0
+    while num_seams > 0:
+        if forward:
+            coarse_seam = _get_forward_seam(coarse, coarse_aux)
+        else:
+            coarse_energy = _get_energy(coarse)
+            if coarse_aux is not None:
+                coarse_energy += coarse_aux
+            coarse_seam = _get_backward_seam(coarse_energy)
+        if tracker is not None:
+            tracker.lap("dp")
+
+        # each coarse seam stands for `scale` seams at full resolution
+        centers = coarse_seam[coarse_rows] * scale + scale // 2
+        for _ in range(min(scale, num_seams)):
+            cur_w = gray.shape[1]
+            lo = np.clip(centers - band_width, 0, cur_w - 1).astype(np.int32)
+            hi = np.clip(centers + band_width + 1, 1, cur_w).astype(np.int32)
+            # the band kernel fuses energy, DP and backtracking
+            seam = _get_band_seam(gray, aux_energy, lo, hi, forward)
+            found += 1
+            seams[rows, idx_map[rows, seam]] = found
+            if tracker is not None:
+                tracker.lap("dp")
+
+            seam_mask = _get_seam_mask(gray, seam)
+            gray = _remove_seam_mask(gray, seam_mask)
+            idx_map = _remove_seam_mask(idx_map, seam_mask)
+            if aux_energy is not None:
+                aux_energy = _remove_seam_mask(aux_energy, seam_mask)
+            num_seams -= 1
+            if tracker is not None:
+                tracker.lap("removal")
+                tracker.update(1, gray, idx_map, aux_energy, coarse, seams)
+
+        seam_mask = _get_seam_mask(coarse, coarse_seam)
+        coarse = _remove_seam_mask(coarse, seam_mask)
+        if coarse_aux is not None:
+            coarse_aux = _remove_seam_mask(coarse_aux, seam_mask)
+        if tracker is not None:
+            tracker.lap("removal")
 
     return seams
 
 
 def _get_seams(
-    gray: np.ndarray, num_seams: int, energy_mode: str, aux_energy: Optional[np.ndarray]
+    gray: np.ndarray,
+    num_seams: int,
+    energy_mode: str,
+    aux_energy: Optional[np.ndarray],
+    seams_per_pass: int = 1,
+    pyramid_levels: int = 0,
+    band_width: int = 4,
+    labeled: bool = False,
 ) -> np.ndarray:
-    """Get the minimum N seams from the grayscale image"""
-    gray = np.asarray(gray, dtype=np.float32)
+    """Get the minimum N seams from the grayscale image.
+
+    :param labeled: Return the 1-based order in which each seam was found
+        instead of a mask, so that seams can be told apart.
+    """
+    # 8-bit grayscale is kept as is by the single-seam backward and forward paths
+    if gray.dtype != np.uint8 or pyramid_levels > 0 or seams_per_pass > 1:
+        gray = np.asarray(gray, dtype=np.float32)
+    elif not gray.flags.writeable:
+        gray = gray.copy()
+    if pyramid_levels > 0 and energy_mode in _list_enum(EnergyMode):
+        return _get_pyramid_seams(
+            gray,
+            num_seams,
+            energy_mode,
+            aux_energy,
+            pyramid_levels,
+            band_width,
+            labeled,
+        )
+    if seams_per_pass > 1 and energy_mode in _list_enum(EnergyMode):
+        return _get_multi_seams(
+            gray, num_seams, energy_mode, aux_energy, seams_per_pass, labeled
+        )
     if energy_mode == EnergyMode.BACKWARD:
-        return _get_backward_seams(gray, num_seams, aux_energy)
+        return _get_backward_seams(gray, num_seams, aux_energy, labeled)
     elif energy_mode == EnergyMode.FORWARD:
-        return _get_forward_seams(gray, num_seams, aux_energy)
+        return _get_forward_seams(gray, num_seams, aux_energy, labeled)
     else:
         raise ValueError(
             f"expect energy_mode to be one of {_list_enum(EnergyMode)}, got {energy_mode}"
@@ -215,83 +723,198 @@ def _reduce_width(
     delta_width: int,
     energy_mode: str,
     aux_energy: Optional[np.ndarray],
+    seams_per_pass: int = 1,
+    pyramid_levels: int = 0,
+    band_width: int = 4,
 ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
     """Reduce the width of image by delta_width pixels"""
     assert src.ndim in (2, 3) and delta_width >= 0
-    if src.ndim == 2:
-        gray = src
-        src_h, src_w = src.shape
-        dst_shape: Tuple[int, ...] = (src_h, src_w - delta_width)
-    else:
-        gray = _rgb2gray(src)
-        src_h, src_w, src_c = src.shape
-        dst_shape = (src_h, src_w - delta_width, src_c)
-
-    to_keep = _get_seams(gray, delta_width, energy_mode, aux_energy)
-    dst = src.copy()
-    dst[to_keep] = [1, 0, 0]
+    gray = src if src.ndim == 2 else _rgb2gray(src)
+    seams = _get_seams(
+        gray,
+        delta_width,
+        energy_mode,
+        aux_energy,
+        seams_per_pass,
+        pyramid_levels,
+        band_width,
+    )
+    dst = _remove_seams(src, seams, delta_width)
     if aux_energy is not None:
-        aux_energy = aux_energy[to_keep].reshape(dst_shape[:2])
+        aux_energy = _remove_seams(aux_energy, seams, delta_width)
+    tracker = _TRACKER.get()
+    if tracker is not None:
+        tracker.lap("removal")
+        tracker.update(0, src, dst, aux_energy, seams)
     return dst, aux_energy
 
 
-@nb.njit(
-    nb.float32[:, :, :](nb.float32[:, :, :], nb.boolean[:, :], nb.int32), cache=True
-)
-def _insert_seams_kernel(
+@nb.njit(parallel=True, cache=True)
+def _remove_seams_kernel(
     src: np.ndarray, seams: np.ndarray, delta_width: int
 ) -> np.ndarray:
-    """The numba kernel for inserting seams"""
+    """The numba kernel for removing seams"""
     src_h, src_w, src_c = src.shape
-    dst = np.empty((src_h, src_w + delta_width, src_c), dtype=src.dtype)
-    for row in range(src_h):
+    dst = np.empty((src_h, src_w - delta_width, src_c), dtype=src.dtype)
+    for row in nb.prange(src_h):
         dst_col = 0
         for src_col in range(src_w):
-            if seams[row, src_col]:
-                left = src[row, max(src_col - 1, 0)]
-                right = src[row, src_col]
-                dst[row, dst_col] = (left + right) / 2
+            if not seams[row, src_col]:
+                dst[row, dst_col] = src[row, src_col]
                 dst_col += 1
+    return dst
+
+
+def _remove_seams(src: np.ndarray, seams: np.ndarray, delta_width: int) -> np.ndarray:
+    """Remove multiple seams from the source image"""
+    if src.ndim == 2:
+        return _remove_seams_kernel(src[:, :, None], seams, delta_width).squeeze(-1)
+    return _remove_seams_kernel(src, seams, delta_width)
+
+
+@nb.njit(parallel=True, cache=True)
+def _insert_seams_kernel(
+    src: np.ndarray, seams: np.ndarray, dst: np.ndarray, copies: int, extra: int
+) -> None:
+    """The numba kernel for inserting seams into a preallocated output.
+
+    The seams labeled 1 to `extra` are inserted `copies + 1` times, the others
+    `copies` times, interpolating between the seam and its left neighbor.
+    """
+    src_h, src_w, src_c = src.shape
+    for row in nb.prange(src_h):
+        dst_col = 0
+        for src_col in range(src_w):
+            label = seams[row, src_col]
+            if label:
+                left = max(src_col - 1, 0)
+                num_copies = copies + 1 if label <= extra else copies
+                for k in range(1, num_copies + 1):
+                    # interpolate per channel to avoid 8-bit overflow
+                    for ch in range(src_c):
+                        if num_copies == 1:
+                            dst[row, dst_col, ch] = (
+                                src[row, left, ch] + src[row, src_col, ch]
+                            ) / 2
+                        else:
+                            dst[row, dst_col, ch] = (
+                                src[row, left, ch] * (num_copies + 1 - k)
+                                + src[row, src_col, ch] * k
+                            ) / (num_copies + 1)
+                    dst_col += 1
             dst[row, dst_col] = src[row, src_col]
             dst_col += 1
-    return dst
 
 
-def _insert_seams(src: np.ndarray, seams: np.ndarray, delta_width: int) -> np.ndarray:
-    """Insert multiple seams into the source image"""
-    dst = src.astype(np.float32)
-    if dst.ndim == 2:
-        dst = dst[:, :, None]
-    dst = _insert_seams_kernel(dst, seams, delta_width).astype(src.dtype)
+def _insert_seams(
+    src: np.ndarray, seams: np.ndarray, dst: np.ndarray, copies: int = 1, extra: int = 0
+) -> np.ndarray:
+    """Insert multiple seams into the source image, writing the result to dst.
+
+    The seams are a mask if `extra` is 0, else labeled as by `_get_seams`.
+    """
     if src.ndim == 2:
-        dst = dst.squeeze(-1)
+        _insert_seams_kernel(src[:, :, None], seams, dst[:, :, None], copies, extra)
+    else:
+        _insert_seams_kernel(src, seams, dst, copies, extra)
     return dst
 
 
+def _get_expand_steps(width: int, delta_width: int, step_ratio: float) -> List[int]:
+    """Split an expansion into steps of at most step_ratio of the current width"""
+    steps = []
+    while delta_width > 0:
+        max_step_size = max(1, round(step_ratio * width))
+        step_size = min(max_step_size, delta_width)
+        steps.append(step_size)
+        width += step_size
+        delta_width -= step_size
+    return steps
+
+
+def _get_expand_buffers(
+    src: np.ndarray, width: int, num_steps: int
+) -> List[np.ndarray]:
+    """Preallocate the outputs of the expansion steps, alternating between two.
+
+    The buffers are flat, so the output of each step is a contiguous view.
+    """
+    size = src.size // src.shape[1] * width
+    return [np.empty(size, dtype=src.dtype) for _ in range(min(num_steps, 2))]
+
+
+def _get_step_output(buffer: np.ndarray, src: np.ndarray, width: int) -> np.ndarray:
+    """View the head of a flat buffer as src expanded to the given width"""
+    shape = (src.shape[0], width) + src.shape[2:]
+    return buffer[: src.size // src.shape[1] * width].reshape(shape)
+
+
 def _expand_width(
     src: np.ndarray,
     delta_width: int,
     energy_mode: str,
     aux_energy: Optional[np.ndarray],
     step_ratio: float,
+    seams_per_pass: int = 1,
+    pyramid_levels: int = 0,
+    band_width: int = 4,
+    copies_per_seam: int = 1,
 ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
     """Expand the width of image by delta_width pixels"""
     assert src.ndim in (2, 3) and delta_width >= 0
     if not 0 < step_ratio <= 1:
         raise ValueError(f"expect `step_ratio` to be between (0,1], got {step_ratio}")
 
-    dst = src
-    while delta_width > 0:
-        max_step_size = max(1, round(step_ratio * dst.shape[1]))
-        step_size = min(max_step_size, delta_width)
-        gray = dst if dst.ndim == 2 else _rgb2gray(dst)
-        seams = _get_seams(gray, step_size, energy_mode, aux_energy)
-        dst = _insert_seams(dst, seams, step_size)
+    # 8-bit images are expanded as is, others in float32. The seams of a step are
+    # all searched at once and then inserted in one pass, and each step writes to
+    # one of at most two buffers allocated at the final width.
+    work_dtype = np.uint8 if src.dtype == np.uint8 else np.float32
+    dst = np.asarray(src, dtype=work_dtype)
+    if not dst.flags.writeable:
+        dst = dst.copy()
+    # the image is rounded to its own type after each step unless that is lossless
+    round_trip = not np.can_cast(work_dtype, src.dtype)
+    steps = _get_expand_steps(src.shape[1], delta_width, step_ratio)
+    width = src.shape[1] + delta_width
+    buffers = _get_expand_buffers(dst, width, len(steps))
+    aux_buffers = []
+    if aux_energy is not None:
+        aux_energy = np.asarray(aux_energy, dtype=np.float32)
+        aux_buffers = _get_expand_buffers(aux_energy, width, len(steps))
+
+    tracker = _TRACKER.get()
+    for i, step_size in enumerate(steps):
+        # the seams are searched on the gray map of the image in its own type
+        gray = dst if dst.dtype == src.dtype else dst.astype(src.dtype)
+        if gray.ndim == 3:
+            gray = _rgb2gray(gray)
+        # each seam found is inserted up to `copies_per_seam` times
+        num_seams = -(-step_size // copies_per_seam)
+        copies, extra = divmod(step_size, num_seams)
+        seams = _get_seams(
+            gray,
+            num_seams,
+            energy_mode,
+            aux_energy,
+            seams_per_pass,
+            pyramid_levels,
+            band_width,
+            # the cheapest `extra` seams get one more copy, whatever their column
+            labeled=extra > 0,
+        )
+        step_w = dst.shape[1] + step_size
+        buf = _get_step_output(buffers[i % 2], dst, step_w)
+        dst = _insert_seams(dst, seams, buf, copies, extra)
+        if round_trip:
+            dst[...] = dst.astype(src.dtype)
         if aux_energy is not None:
-            aux_energy = _insert_seams(aux_energy, seams, step_size)
-        delta_width -= step_size
+            aux_buf = _get_step_output(aux_buffers[i % 2], aux_energy, step_w)
+            aux_energy = _insert_seams(aux_energy, seams, aux_buf, copies, extra)
+        if tracker is not None:
+            tracker.lap("insertion")
+            tracker.update(0, *buffers, *aux_buffers, seams)
 
-    return dst, aux_energy
+    return dst.astype(src.dtype, copy=False), aux_energy
 
 
 def _resize_width(
@@ -300,6 +923,10 @@ def _resize_width(
     energy_mode: str,
     aux_energy: Optional[np.ndarray],
     step_ratio: float,
+    seams_per_pass: int = 1,
+    pyramid_levels: int = 0,
+    band_width: int = 4,
+    copies_per_seam: int = 1,
 ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
     """Resize the width of image by removing vertical seams"""
     assert src.size > 0 and src.ndim in (2, 3)
@@ -308,10 +935,26 @@ def _resize_width(
     src_w = src.shape[1]
     if src_w < width:
         dst, aux_energy = _expand_width(
-            src, width - src_w, energy_mode, aux_energy, step_ratio
+            src,
+            width - src_w,
+            energy_mode,
+            aux_energy,
+            step_ratio,
+            seams_per_pass,
+            pyramid_levels,
+            band_width,
+            copies_per_seam,
         )
     else:
-        dst, aux_energy = _reduce_width(src, src_w - width, energy_mode, aux_energy)
+        dst, aux_energy = _reduce_width(
+            src,
+            src_w - width,
+            energy_mode,
+            aux_energy,
+            seams_per_pass,
+            pyramid_levels,
+            band_width,
+        )
     return dst, aux_energy
 
 
@@ -330,19 +973,151 @@ def _resize_height(
     energy_mode: str,
     aux_energy: Optional[np.ndarray],
     step_ratio: float,
+    seams_per_pass: int = 1,
+    pyramid_levels: int = 0,
+    band_width: int = 4,
+    copies_per_seam: int = 1,
 ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
     """Resize the height of image by removing horizontal seams"""
     assert src.ndim in (2, 3) and height > 0
     if aux_energy is not None:
         aux_energy = aux_energy.T
     src = _transpose_image(src)
-    src, aux_energy = _resize_width(src, height, energy_mode, aux_energy, step_ratio)
+    src, aux_energy = _resize_width(
+        src,
+        height,
+        energy_mode,
+        aux_energy,
+        step_ratio,
+        seams_per_pass,
+        pyramid_levels,
+        band_width,
+        copies_per_seam,
+    )
     src = _transpose_image(src)
     if aux_energy is not None:
         aux_energy = aux_energy.T
     return src, aux_energy
 
 
+def _carve_proxy(
+    gray: np.ndarray, energy_mode: str, aux_energy: Optional[np.ndarray]
+) -> Tuple[float, np.ndarray, Optional[np.ndarray]]:
+    """Remove the minimum vertical seam from a proxy map and return its cost"""
+    if energy_mode == EnergyMode.BACKWARD:
+        energy = _get_energy(gray)
+        if aux_energy is not None:
+            energy += aux_energy
+        parent, cost = _get_backward_cost(energy)
+    else:
+        parent, cost = _get_forward_cost(gray, aux_energy)
+    col = np.argmin(cost)
+    seam_mask = _get_seam_mask(gray, _backtrack_seam(parent, np.int32(col)))
+    gray = _remove_seam_mask(gray, seam_mask)
+    if aux_energy is not None:
+        aux_energy = _remove_seam_mask(aux_energy, seam_mask)
+    return float(cost[col]), gray, aux_energy
+
+
+def _carve_proxy_horizontal(
+    gray: np.ndarray, energy_mode: str, aux_energy: Optional[np.ndarray]
+) -> Tuple[float, np.ndarray, Optional[np.ndarray]]:
+    """Remove the minimum horizontal seam from a proxy map and return its cost"""
+    if aux_energy is not None:
+        aux_energy = aux_energy.T
+    cost, gray, aux_energy = _carve_proxy(gray.T, energy_mode, aux_energy)
+    if aux_energy is not None:
+        aux_energy = aux_energy.T
+    return cost, gray.T, aux_energy
+
+
+def _get_optimal_order(
+    src: np.ndarray,
+    width: int,
+    height: int,
+    energy_mode: str,
+    aux_energy: Optional[np.ndarray],
+) -> List[Tuple[int, int]]:
+    """Choose the interleaving of vertical and horizontal seams by the transport map.
+
+    The transport map is computed on a proxy downscaled to at most
+    OPTIMAL_ORDER_PROXY_SIZE pixels per side. Returns the intermediate
+    (width, height) targets to resize to in turn.
+    """
+    src_h, src_w = src.shape[:2]
+    if width >= src_w or height >= src_h:
+        return [(width, src_h), (width, height)]
+
+    gray = np.asarray(src if src.ndim == 2 else _rgb2gray(src), dtype=np.float32)
+    while max(gray.shape) > OPTIMAL_ORDER_PROXY_SIZE:
+        gray = _pyr_down(gray)
+        if aux_energy is not None:
+            aux_energy = _pyr_down(aux_energy)
+    proxy_h, proxy_w = gray.shape
+    num_rows = min(round((src_h - height) * proxy_h / src_h), proxy_h - 1)
+    num_cols = min(round((src_w - width) * proxy_w / src_w), proxy_w - 1)
+    if num_rows == 0 or num_cols == 0:
+        return [(width, src_h), (width, height)]
+
+    # transport[r, c] is the minimum cost to remove r horizontal and c vertical seams
+    transport = np.zeros((num_rows + 1, num_cols + 1), dtype=np.float64)
+    is_vertical = np.zeros((num_rows + 1, num_cols + 1), dtype=bool)
+    prev_row = [(gray, aux_energy)]
+    for c in range(1, num_cols + 1):
+        prev_gray, prev_aux = prev_row[-1]
+        cost, prev_gray, prev_aux = _carve_proxy(prev_gray, energy_mode, prev_aux)
+        transport[0, c] = transport[0, c - 1] + cost
+        is_vertical[0, c] = True
+        prev_row.append((prev_gray, prev_aux))
+
+    for r in range(1, num_rows + 1):
+        curr_row = []
+        for c in range(num_cols + 1):
+            prev_gray, prev_aux = prev_row[c]
+            cost, proxy_gray, proxy_aux = _carve_proxy_horizontal(
+                prev_gray, energy_mode, prev_aux
+            )
+            transport[r, c] = transport[r - 1, c] + cost
+            if c > 0:
+                left_gray, left_aux = curr_row[c - 1]
+                cost, left_gray, left_aux = _carve_proxy(
+                    left_gray, energy_mode, left_aux
+                )
+                if transport[r, c - 1] + cost < transport[r, c]:
+                    transport[r, c] = transport[r, c - 1] + cost
+                    is_vertical[r, c] = True
+                    proxy_gray, proxy_aux = left_gray, left_aux
+            curr_row.append((proxy_gray, proxy_aux))
+        prev_row = curr_row
+
+    path = []
+    r, c = num_rows, num_cols
+    while r > 0 or c > 0:
+        path.append(is_vertical[r, c])
+        if is_vertical[r, c]:
+            c -= 1
+        else:
+            r -= 1
+    path.reverse()
+
+    # map each run of proxy seams in one direction to a full-resolution target
+    targets = []
+    r = c = 0
+    for i, vertical in enumerate(path):
+        if vertical:
+            c += 1
+        else:
+            r += 1
+        if i + 1 == len(path) or path[i + 1] != vertical:
+            targets.append(
+                (
+                    src_w - round(c * (src_w - width) / num_cols),
+                    src_h - round(r * (src_h - height) / num_rows),
+                )
+            )
+    return targets
+
+
 def _check_mask(mask: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
     """Ensure the mask to be a 2D grayscale map of specific shape"""
     mask = np.asarray(mask, dtype=bool)
@@ -365,6 +1140,83 @@ def _check_src(src: np.ndarray) -> np.ndarray:
     return src
 
 
+def _remove_object(
+    src: np.ndarray,
+    drop_mask: np.ndarray,
+    energy_mode: str,
+    aux_energy: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Remove the object in drop_mask by vertical seams searched near the object.
+
+    Seams are searched and removed within a strip of the image around the
+    object's bounding box, widened by OBJECT_MARGIN columns on each side. A
+    seam may drift one column per row away from the box, up to that margin.
+    The number of object pixels left in each row is tracked as seams are
+    removed, and the seams are removed from the full image once at the end.
+    """
+    gray = np.asarray(src if src.ndim == 2 else _rgb2gray(src), dtype=np.float32)
+    h, w = gray.shape
+    seams = np.zeros((h, w), dtype=bool)
+    rows = np.arange(h, dtype=np.int32)
+    forward = energy_mode == EnergyMode.FORWARD
+    tracker = _TRACKER.get()
+    num_seams = 0
+
+    remaining = drop_mask.sum(1)
+    obj_rows = np.flatnonzero(remaining)
+    if obj_rows.size > 0:
+        obj_cols = np.flatnonzero(drop_mask[obj_rows[0] : obj_rows[-1] + 1].any(0))
+        c0, c1 = obj_cols[0], obj_cols[-1]
+        # one more column on each side, which seams never enter, gives the
+        # energy at the border of the strip
+        x0 = max(c0 - OBJECT_MARGIN - 1, 0)
+        x1 = min(c1 + OBJECT_MARGIN + 2, w)
+        min_col = 1 if x0 > 0 else 0
+        pad_hi = 1 if x1 < w else 0
+        c0, c1 = c0 - x0, c1 - x0
+        gray = np.ascontiguousarray(gray[:, x0:x1])
+        idx_map = np.ascontiguousarray(_get_idx_map(h, w)[:, x0:x1])
+        strip_aux = np.ascontiguousarray(aux_energy[:, x0:x1])
+        drop_mask = np.ascontiguousarray(drop_mask[:, x0:x1])
+
+    while obj_rows.size > 0:
+        r0, r1 = obj_rows[0], obj_rows[-1]
+        dist = np.maximum(np.maximum(r0 - rows, rows - r1), 0)
+        dist = np.minimum(dist, OBJECT_MARGIN)
+        lo = np.maximum(c0 - dist, min_col).astype(np.int32)
+        hi = np.minimum(c1 + 1 + dist, gray.shape[1] - pad_hi).astype(np.int32)
+        seam = _get_band_seam(gray, strip_aux, lo, hi, forward)
+        seams[rows, idx_map[rows, seam]] = True
+        remaining -= drop_mask[rows, seam]
+        num_seams += 1
+        if tracker is not None:
+            tracker.lap("dp")
+
+        seam_mask = _get_seam_mask(gray, seam)
+        gray = _remove_seams(gray, seam_mask, 1)
+        idx_map = _remove_seams(idx_map, seam_mask, 1)
+        strip_aux = _remove_seams(strip_aux, seam_mask, 1)
+        drop_mask = _remove_seams(drop_mask, seam_mask, 1)
+
+        # object pixels shift left by at most one column per seam
+        obj_rows = np.flatnonzero(remaining)
+        if obj_rows.size > 0:
+            c0 = max(c0 - 1, min_col)
+            window = drop_mask[obj_rows[0] : obj_rows[-1] + 1, c0 : c1 + 1]
+            obj_cols = np.flatnonzero(window.any(0))
+            c0, c1 = c0 + obj_cols[0], c0 + obj_cols[-1]
+        if tracker is not None:
+            tracker.lap("removal")
+            tracker.update(1, gray, idx_map, strip_aux, drop_mask, seams)
+
+    dst = _remove_seams(src, seams, num_seams)
+    aux_energy = _remove_seams(aux_energy, seams, num_seams)
+    if tracker is not None:
+        tracker.lap("removal")
+        tracker.update(0, src, dst, aux_energy, seams)
+    return dst, aux_energy
+
+
 def resize(
     src: np.ndarray,
     size: Optional[Tuple[int, int]] = None,
@@ -373,6 +1225,12 @@ def resize(
     keep_mask: Optional[np.ndarray] = None,
     drop_mask: Optional[np.ndarray] = None,
     step_ratio: float = 0.5,
+    seams_per_pass: int = 1,
+    pyramid_levels: int = 0,
+    band_width: int = 4,
+    copies_per_seam: int = 1,
+    num_threads: Optional[int] = None,
+    progress_callback: Optional[Callable[[CarveProgress], Optional[bool]]] = None,
 ) -> np.ndarray:
     """Resize the image using the content-aware seam-carving algorithm.
 
@@ -383,15 +1241,49 @@ def resize(
         as the gradient at each pixel. If ``forward``, compute the energy as the
         distances between adjacent pixels after each pixel is removed.
     :param order: The order to remove horizontal and vertical seams. Could be
-        one of ``width-first`` or ``height-first``. In ``width-first`` mode, we
-        remove or insert all vertical seams first, then the horizontal ones,
-        while ``height-first`` is the opposite.
+        one of ``width-first``, ``height-first`` or ``optimal``. In ``width-first``
+        mode, we remove or insert all vertical seams first, then the horizontal
+        ones, while ``height-first`` is the opposite. In ``optimal`` mode, the
+        interleaving of vertical and horizontal seams is chosen by the
+        transport-map dynamic program, computed on a downscaled proxy of the
+        image. It falls back to ``width-first`` unless both dimensions shrink.
     :param keep_mask: An optional mask where the foreground is protected from
         seam removal. If not specified, no area will be protected.
     :param drop_mask: An optional binary object mask to remove. If given, the
         object will be removed before resizing the image to the target size.
+        Its seams are searched within ``OBJECT_MARGIN`` columns of the object.
     :param step_ratio: The maximum size expansion ratio in one seam carving step.
         The image will be expanded in multiple steps if target size is too large.
+    :param seams_per_pass: The maximum number of seams extracted from a single
+        cumulative-cost pass. If greater than 1, an approximate mode is used,
+        where up to ``seams_per_pass`` non-overlapping seams are backtracked from
+        the cheapest bottom-row entries and removed together. This trades some
+        seam optimality for speed on large images. Object removal always
+        extracts one seam per pass.
+    :param pyramid_levels: The number of Gaussian pyramid levels used for a
+        coarse-to-fine seam search. If positive, seams are found on the image
+        downsampled by ``2 ** pyramid_levels`` and refined at full resolution
+        within a narrow band around the upsampled path, so the full-resolution
+        DP cost scales with the band width instead of the image width. Takes
+        precedence over ``seams_per_pass``.
+    :param band_width: The half width in pixels of the refinement band in the
+        coarse-to-fine search. It is at least ``2 ** pyramid_levels``.
+    :param copies_per_seam: The maximum number of times each seam is inserted
+        when expanding. If greater than 1, each expansion step searches only
+        ``1 / copies_per_seam`` of the seams it inserts, and every seam is
+        repeated with values interpolated between the seam and its left
+        neighbor. This makes large upscales several times cheaper, at the cost
+        of wider stretched regions. ``step_ratio`` still bounds each step.
+    :param num_threads: The number of threads used by the row-parallel kernels
+        (energy, seam removal and seam insertion), between 1 and numba's
+        ``NUMBA_NUM_THREADS``. If not specified, the current numba setting is
+        used. Results do not depend on the thread count.
+    :param progress_callback: An optional function called with a ``CarveProgress``
+        after each seam batch and after each removal or insertion step. It
+        reports the seams carved so far out of the total, the time spent per
+        stage and the size of the working buffers. If it returns ``True``,
+        ``resize`` stops and raises ``CarveCancelled``. With ``drop_mask``, the
+        total starts from an estimate and may grow during object removal.
     :return: A resized copy of the source image.
     """
     src = _check_src(src)
@@ -401,57 +1293,112 @@ def resize(
             f"expect order to be one of {_list_enum(OrderMode)}, got {order}"
         )
 
-    aux_energy = None
-
-    if keep_mask is not None:
-        keep_mask = _check_mask(keep_mask, src.shape[:2])
-
-        aux_energy = np.zeros(src.shape[:2], dtype=np.float32)
-        aux_energy[keep_mask] += KEEP_MASK_ENERGY
+    if seams_per_pass < 1:
+        raise ValueError(
+            f"expect `seams_per_pass` to be a positive integer, got {seams_per_pass}"
+        )
 
-    # remove object if `drop_mask` is given
-    if drop_mask is not None:
-        drop_mask = _check_mask(drop_mask, src.shape[:2])
+    if pyramid_levels < 0:
+        raise ValueError(
+            f"expect `pyramid_levels` to be non-negative, got {pyramid_levels}"
+        )
 
-        if aux_energy is None:
-            aux_energy = np.zeros(src.shape[:2], dtype=np.float32)
-        aux_energy[drop_mask] -= DROP_MASK_ENERGY
+    if band_width < 1:
+        raise ValueError(f"expect `band_width` to be positive, got {band_width}")
 
-        if order == OrderMode.HEIGHT_FIRST:
-            src = _transpose_image(src)
-            aux_energy = aux_energy.T
+    if copies_per_seam < 1:
+        raise ValueError(
+            f"expect `copies_per_seam` to be a positive integer, got {copies_per_seam}"
+        )
 
-        num_seams = (aux_energy < 0).sum(1).max()
-        while num_seams > 0:
-            src, aux_energy = _reduce_width(src, num_seams, energy_mode, aux_energy)
-            num_seams = (aux_energy < 0).sum(1).max()
+    if num_threads is not None and not 1 <= num_threads <= nb.config.NUMBA_NUM_THREADS:
+        raise ValueError(
+            f"expect `num_threads` to be between 1 and NUMBA_NUM_THREADS="
+            f"{nb.config.NUMBA_NUM_THREADS}, got {num_threads}"
+        )
 
-        if order == OrderMode.HEIGHT_FIRST:
-            src = _transpose_image(src)
-            aux_energy = aux_energy.T
+    with _numba_threads(num_threads), _track_progress(progress_callback) as tracker:
+        aux_energy = None
 
-    # resize image if `size` is given
-    if size is not None:
-        width, height = size
-        width = round(width)
-        height = round(height)
-        if width <= 0 or height <= 0:
-            raise ValueError(f"expect target size to be positive, got {size}")
+        if keep_mask is not None:
+            keep_mask = _check_mask(keep_mask, src.shape[:2])
 
-        if order == OrderMode.WIDTH_FIRST:
-            src, aux_energy = _resize_width(
-                src, width, energy_mode, aux_energy, step_ratio
-            )
-            src, aux_energy = _resize_height(
-                src, height, energy_mode, aux_energy, step_ratio
-            )
-        else:
-            src, aux_energy = _resize_height(
-                src, height, energy_mode, aux_energy, step_ratio
-            )
-            src, aux_energy = _resize_width(
-                src, width, energy_mode, aux_energy, step_ratio
-            )
+            aux_energy = np.zeros(src.shape[:2], dtype=np.float32)
+            aux_energy[keep_mask] += KEEP_MASK_ENERGY
+
+        # remove object if `drop_mask` is given
+        if drop_mask is not None:
+            drop_mask = _check_mask(drop_mask, src.shape[:2])
+
+            if aux_energy is None:
+                aux_energy = np.zeros(src.shape[:2], dtype=np.float32)
+            aux_energy[drop_mask] -= DROP_MASK_ENERGY
+
+            if tracker is not None:
+                # at least as many seams as the widest row of the object
+                axis = 0 if order == OrderMode.HEIGHT_FIRST else 1
+                tracker.expect(int(drop_mask.sum(axis).max()))
+
+            if order == OrderMode.HEIGHT_FIRST:
+                src = _transpose_image(src)
+                aux_energy = aux_energy.T
+                drop_mask = drop_mask.T
+
+            src, aux_energy = _remove_object(src, drop_mask, energy_mode, aux_energy)
+
+            if order == OrderMode.HEIGHT_FIRST:
+                src = _transpose_image(src)
+                aux_energy = aux_energy.T
+
+        # resize image if `size` is given
+        if size is not None:
+            width, height = size
+            width = round(width)
+            height = round(height)
+            if width <= 0 or height <= 0:
+                raise ValueError(f"expect target size to be positive, got {size}")
+
+            if tracker is not None:
+                src_h, src_w = src.shape[:2]
+                tracker.expect(abs(src_w - width) + abs(src_h - height))
+
+            if order == OrderMode.OPTIMAL:
+                targets = _get_optimal_order(
+                    src, width, height, energy_mode, aux_energy
+                )
+                if tracker is not None:
+                    # the transport map is itself a dynamic program
+                    tracker.lap("dp")
+            elif order == OrderMode.WIDTH_FIRST:
+                targets = [(width, src.shape[0]), (width, height)]
+            else:
+                targets = [(src.shape[1], height), (width, height)]
+
+            for target_w, target_h in targets:
+                if target_w != src.shape[1]:
+                    src, aux_energy = _resize_width(
+                        src,
+                        target_w,
+                        energy_mode,
+                        aux_energy,
+                        step_ratio,
+                        seams_per_pass,
+                        pyramid_levels,
+                        band_width,
+                        copies_per_seam,
+                    )
+                if target_h != src.shape[0]:
+                    src, aux_energy = _resize_height(
+                        src,
+                        target_h,
+                        energy_mode,
+                        aux_energy,
+                        step_ratio,
+                        seams_per_pass,
+                        pyramid_levels,
+                        band_width,
+                        copies_per_seam,
+                    )
 
     return src
 
@@ -480,19 +1427,568 @@ def remove_object(
     if keep_mask is not None:
         keep_mask = _check_mask(keep_mask, src.shape[:2])
 
+    aux_energy = np.zeros(src.shape[:2], dtype=np.float32)
+    aux_energy[drop_mask] -= DROP_MASK_ENERGY
+    if keep_mask is not None:
+        aux_energy[keep_mask] += KEEP_MASK_ENERGY
+
+    src, _ = _remove_object(src, drop_mask, EnergyMode.BACKWARD, aux_energy)
+    return src
+
+
+@nb.njit(cache=True)
+def _stream_cost_rows(
+    gray: np.ndarray,
+    prev_row: np.ndarray,
+    next_row: np.ndarray,
+    cost: np.ndarray,
+    parent: np.ndarray,
+    forward: bool,
+    first: bool,
+) -> None:
+    """Advance the cumulative cost over a chunk of rows, keeping only two cost rows.
+
+    ``prev_row`` and ``next_row`` are the gray rows just above and below the chunk,
+    ``cost`` holds the cumulative cost of the row above the chunk and is updated in
+    place, and ``parent`` receives the column offset (-1, 0 or 1) of each pixel.
+    """
+    n, w = gray.shape
+    new_cost = np.empty(w, dtype=np.float32)
+    for i in range(n):
+        row = gray[i]
+        above = prev_row if i == 0 else gray[i - 1]
+        below = next_row if i == n - 1 else gray[i + 1]
+        for j in range(w):
+            left = row[max(j - 1, 0)]
+            right = row[min(j + 1, w - 1)]
+            if forward:
+                cost_mid = np.abs(right - left)
+            else:
+                grad_y = row[j] - below[j]
+                grad_x = row[j] - right
+                cost_mid = np.sqrt(grad_y * grad_y + grad_x * grad_x)
+
+            if first and i == 0:
+                new_cost[j] = cost_mid
+                parent[i, j] = 0
+                continue
+
+            best = np.inf
+            best_dc = 0
+            for dc in range(-1, 2):
+                pc = j + dc
+                if pc < 0 or pc >= w:
+                    continue
+                step = cost_mid
+                if forward and dc != 0:
+                    step += np.abs(above[j] - (left if dc < 0 else right))
+                c = cost[pc] + step
+                if c < best:
+                    best = c
+                    best_dc = dc
+            new_cost[j] = best
+            parent[i, j] = best_dc
+        cost[:] = new_cost
+
+
+@nb.njit(cache=True)
+def _shift_out_seam(src: np.ndarray, seam: np.ndarray, width: int) -> None:
+    """Remove a seam in place by shifting the pixels on its right one column to the left"""
+    for r in range(src.shape[0]):
+        for c in range(seam[r], width - 1):
+            src[r, c] = src[r, c + 1]
+
+
+def _stream_gray(src: np.ndarray) -> np.ndarray:
+    """Convert a chunk of source rows to a float32 grayscale map.
+
+    8-bit rows are converted like in ``resize``, so both carve the same seams.
+    """
+    if src.dtype != np.uint8:
+        src = np.asarray(src, dtype=np.float32)
     gray = src if src.ndim == 2 else _rgb2gray(src)
+    return np.asarray(gray, dtype=np.float32)
 
-    while drop_mask.any():
-        energy = _get_energy(gray)
-        energy[drop_mask] -= DROP_MASK_ENERGY
-        if keep_mask is not None:
-            energy[keep_mask] += KEEP_MASK_ENERGY
-        seam = _get_backward_seam(energy)
-        seam_mask = _get_seam_mask(src, seam)
+
+def _stream_transpose(src: np.ndarray, dst: np.ndarray, tile: int) -> None:
+    """Write the transpose of src to dst one square tile at a time"""
+    h, w = src.shape[:2]
+    for r0 in range(0, h, tile):
+        for c0 in range(0, w, tile):
+            block = np.asarray(src[r0 : r0 + tile, c0 : c0 + tile])
+            dst[c0 : c0 + tile, r0 : r0 + tile] = _transpose_image(block)
+
+
+def _stream_reduce_width(
+    work: np.ndarray,
+    delta_width: int,
+    energy_mode: str,
+    chunk_rows: int,
+    parent: np.ndarray,
+) -> None:
+    """Remove delta_width vertical seams in place from the leading columns of work"""
+    h, w = work.shape[:2]
+    forward = energy_mode == EnergyMode.FORWARD
+    for cur_w in range(w, w - delta_width, -1):
+        cost = np.empty(cur_w, dtype=np.float32)
+        prev_row = np.empty(cur_w, dtype=np.float32)
+        for r0 in range(0, h, chunk_rows):
+            r1 = min(r0 + chunk_rows, h)
+            gray = _stream_gray(work[r0 : min(r1 + 1, h), :cur_w])
+            next_row = gray[-1] if r1 == h else gray[r1 - r0]
+            gray = np.ascontiguousarray(gray[: r1 - r0])
+            parent_rows = np.asarray(parent[r0:r1, :cur_w])
+            _stream_cost_rows(
+                gray, prev_row, next_row, cost, parent_rows, forward, r0 == 0
+            )
+            parent[r0:r1, :cur_w] = parent_rows
+            prev_row = gray[-1].copy()
+
+        seam = np.empty(h, dtype=np.int32)
+        col = int(np.argmin(cost))
+        for r in range(h - 1, -1, -1):
+            seam[r] = col
+            col += int(parent[r, col])
+
+        for r0 in range(0, h, chunk_rows):
+            r1 = min(r0 + chunk_rows, h)
+            rows = np.asarray(work[r0:r1])
+            _shift_out_seam(rows, seam[r0:r1], cur_w)
+
+
+def _open_source(
+    src: Union[str, np.ndarray],
+    shape: Optional[Tuple[int, ...]],
+    dtype: Optional[np.dtype],
+) -> np.ndarray:
+    """Open a source image as an array without reading it into memory"""
+    if not isinstance(src, str):
+        return src
+    if src.endswith(".npy"):
+        return np.load(src, mmap_mode="r")
+    if shape is None or dtype is None:
+        raise ValueError("expect `shape` and `dtype` to be given for a raw source file")
+    return np.memmap(src, dtype=dtype, mode="r", shape=shape)
+
+
+def resize_memmap(
+    src: Union[str, np.ndarray],
+    dst_path: str,
+    size: Tuple[int, int],
+    energy_mode: str = "backward",
+    order: str = "width-first",
+    shape: Optional[Tuple[int, ...]] = None,
+    dtype: Optional[np.dtype] = None,
+    chunk_rows: int = 256,
+) -> np.memmap:
+    """Shrink an image that does not fit in memory using streaming seam carving.
+
+    The source is read through a memory map and carved in place in a temporary
+    working file. Each seam is found by a row-streamed DP pass that keeps only two
+    cost rows in memory plus an int8 parent map of column offsets, which is also
+    backed by a temporary file. Horizontal seams are carved from a transposed
+    working file, written and read back in square tiles of ``chunk_rows``
+    pixels. 8-bit images are carved along the same seams as by ``resize``. Keep
+    and drop masks are not supported.
+
+    :param src: A ``np.memmap`` or array in RGB or grayscale format, a path to a
+        ``.npy`` file, or a path to a raw file described by ``shape`` and ``dtype``.
+    :param dst_path: The path of the ``.npy`` file to write the result into.
+    :param size: The target size in pixels, as a 2-tuple (width, height). It must
+        not exceed the source size.
+    :param energy_mode: Policy to compute energy for the source image. Could be
+        one of ``backward`` or ``forward``.
+    :param order: The order to remove horizontal and vertical seams. Could be
+        one of ``width-first`` or ``height-first``.
+    :param shape: The shape of a raw source file.
+    :param dtype: The dtype of a raw source file.
+    :param chunk_rows: The number of rows loaded into memory at a time.
+    :return: A memory map of the resized image stored at ``dst_path``.
+    """
+    src = _check_src(_open_source(src, shape, dtype))
+
+    if energy_mode not in _list_enum(EnergyMode):
+        raise ValueError(
+            f"expect energy_mode to be one of {_list_enum(EnergyMode)}, got {energy_mode}"
+        )
+    fixed_orders = (OrderMode.WIDTH_FIRST.value, OrderMode.HEIGHT_FIRST.value)
+    if order not in fixed_orders:
+        raise ValueError(f"expect order to be one of {fixed_orders}, got {order}")
+
+    src_h, src_w = src.shape[:2]
+    width, height = round(size[0]), round(size[1])
+    if not (0 < width <= src_w and 0 < height <= src_h):
+        raise ValueError(
+            f"expect target size to be positive and within {(src_w, src_h)}, got {size}"
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work = np.memmap(
+            os.path.join(tmp_dir, "work.dat"),
+            dtype=src.dtype,
+            mode="w+",
+            shape=src.shape,
+        )
+        # horizontal seams are carved as vertical ones from a transposed copy, so
+        # that the DP also streams over contiguous rows
+        work_t = np.memmap(
+            os.path.join(tmp_dir, "work_t.dat"),
+            dtype=src.dtype,
+            mode="w+",
+            shape=(src_w, src_h) + src.shape[2:],
+        )
+        parent = np.memmap(
+            os.path.join(tmp_dir, "parent.dat"),
+            dtype=np.int8,
+            mode="w+",
+            shape=(src_h * src_w,),
+        )
+
+        if order == OrderMode.WIDTH_FIRST:
+            for r0 in range(0, src_h, chunk_rows):
+                work[r0 : r0 + chunk_rows] = src[r0 : r0 + chunk_rows]
+            _stream_reduce_width(
+                work,
+                src_w - width,
+                energy_mode,
+                chunk_rows,
+                parent.reshape(src_h, src_w),
+            )
+            work_t = work_t[:width]
+            _stream_transpose(work[:, :width], work_t, chunk_rows)
+            _stream_reduce_width(
+                work_t,
+                src_h - height,
+                energy_mode,
+                chunk_rows,
+                parent[: width * src_h].reshape(width, src_h),
+            )
+            _stream_transpose(work_t[:, :height], work[:height, :width], chunk_rows)
+        else:
+            _stream_transpose(src, work_t, chunk_rows)
+            _stream_reduce_width(
+                work_t,
+                src_h - height,
+                energy_mode,
+                chunk_rows,
+                parent.reshape(src_w, src_h),
+            )
+            _stream_transpose(work_t[:, :height], work[:height], chunk_rows)
+            _stream_reduce_width(
+                work[:height],
+                src_w - width,
+                energy_mode,
+                chunk_rows,
+                parent[: height * src_w].reshape(height, src_w),
+            )
+
+        dst = np.lib.format.open_memmap(
+            dst_path, mode="w+", dtype=src.dtype, shape=(height, width) + src.shape[2:]
+        )
+        for r0 in range(0, height, chunk_rows):
+            dst[r0 : r0 + chunk_rows] = work[r0 : min(r0 + chunk_rows, height), :width]
+        dst.flush()
+        del work, work_t, parent
+
+    return dst
+
+
+def _get_warm_seams(
+    gray: np.ndarray,
+    num_seams: int,
+    energy_mode: str,
+    prev_seams: Optional[List[np.ndarray]],
+    band_width: int,
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Compute N vertical seams, searching only a band around the previous frame's seams.
+
+    Returns the seam mask in source coordinates and the seams in removal order.
+    """
+    h, w = gray.shape
+    seams = np.zeros((h, w), dtype=bool)
+    seam_list = []
+    rows = np.arange(h, dtype=np.int32)
+    idx_map = _get_idx_map(h, w)
+    forward = energy_mode == EnergyMode.FORWARD
+    for k in range(num_seams):
+        cur_w = gray.shape[1]
+        if prev_seams is not None and k < len(prev_seams):
+            lo = np.clip(prev_seams[k] - band_width, 0, cur_w - 1).astype(np.int32)
+            hi = np.clip(prev_seams[k] + band_width + 1, 1, cur_w).astype(np.int32)
+            seam = _get_band_seam(gray, None, lo, hi, forward)
+        elif forward:
+            seam = _get_forward_seam(gray, None)
+        else:
+            seam = _get_backward_seam(_get_energy(gray))
+        seam_list.append(seam)
+        seams[rows, idx_map[rows, seam]] = True
+
+        seam_mask = _get_seam_mask(gray, seam)
         gray = _remove_seam_mask(gray, seam_mask)
-        drop_mask = _remove_seam_mask(drop_mask, seam_mask)
-        src = _remove_seam_mask(src, seam_mask)
-        if keep_mask is not None:
-            keep_mask = _remove_seam_mask(keep_mask, seam_mask)
+        idx_map = _remove_seam_mask(idx_map, seam_mask)
+
+    return seams, seam_list
+
+
+def _reduce_width_warm(
+    src: np.ndarray,
+    width: int,
+    energy_mode: str,
+    prev_seams: Optional[List[np.ndarray]],
+    band_width: int,
+) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Reduce the width of a frame, warm-started from the previous frame's seams"""
+    gray = np.asarray(src if src.ndim == 2 else _rgb2gray(src), dtype=np.float32)
+    delta_width = src.shape[1] - width
+    seams, seam_list = _get_warm_seams(
+        gray, delta_width, energy_mode, prev_seams, band_width
+    )
+    return _remove_seams(src, seams, delta_width), seam_list
+
+
+def _carve_frames(
+    frames: np.ndarray,
+    size: int,
+    transpose: bool,
+    energy_mode: str,
+    band_width: int,
+    prev_seams: Optional[List[np.ndarray]],
+) -> Tuple[np.ndarray, np.ndarray, List[np.ndarray]]:
+    """Shrink one dimension of a chunk of frames in sequence, reusing the seams of
+    each frame for the next.
+
+    `prev_seams` are the seams of the frame before the chunk, if any. The seams
+    of the last frame are returned along with the frames, to seed the next chunk.
+    """
+    dst = []
+    seconds = np.empty(len(frames), dtype=np.float64)
+    for i, src in enumerate(frames):
+        start = time.perf_counter()
+        if transpose:
+            src = _transpose_image(src)
+        src, prev_seams = _reduce_width_warm(
+            src, size, energy_mode, prev_seams, band_width
+        )
+        if transpose:
+            src = _transpose_image(src)
+        dst.append(src)
+        seconds[i] = time.perf_counter() - start
+    return np.stack(dst), seconds, prev_seams
+
+
+def _resize_frames(
+    frames: np.ndarray, width: int, height: int, energy_mode: str, order: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Resize a chunk of frames independently of each other"""
+    dst = []
+    seconds = np.empty(len(frames), dtype=np.float64)
+    for i, src in enumerate(frames):
+        start = time.perf_counter()
+        dst.append(resize(src, (width, height), energy_mode, order))
+        seconds[i] = time.perf_counter() - start
+    return np.stack(dst), seconds
+
+
+def _warmup_calls(src: np.ndarray, energy_mode: str) -> None:
+    """Run every code path of ``resize``, ``resize_frames`` and ``resize_memmap``"""
+    h, w = src.shape[:2]
+    keep_mask = np.zeros((h, w), dtype=bool)
+    keep_mask[: h // 2, : w // 2] = True
+    drop_mask = np.zeros((h, w), dtype=bool)
+    drop_mask[h // 2 :, w // 2 : w // 2 + 2] = True
+    # an odd expansion with two copies per seam gives some seams an extra copy
+    shrink, expand = (w - 4, h - 4), (w + 7, h + 7)
+    for order in _list_enum(OrderMode):
+        resize(src, shrink, energy_mode, order)
+        resize(src, expand, energy_mode, order, keep_mask=keep_mask)
+        resize(src, expand, energy_mode, order, copies_per_seam=2)
+        resize(src, shrink, energy_mode, order, seams_per_pass=2)
+        resize(src, shrink, energy_mode, order, pyramid_levels=1)
+        resize(src, shrink, energy_mode, order, drop_mask=drop_mask)
+        resize(
+            src, shrink, energy_mode, order, keep_mask=keep_mask, drop_mask=drop_mask
+        )
+    resize_frames(np.stack([src] * 3), shrink, energy_mode, chunk_size=2, max_workers=1)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        resize_memmap(src, os.path.join(tmp_dir, "warmup.npy"), shrink, energy_mode)
+
+
+def warmup(
+    energy_modes: Tuple[str, ...] = ("backward", "forward"),
+    dtypes: Tuple[np.dtype, ...] = (np.float32, np.uint8),
+) -> Dict[str, float]:
+    """Compile, or load from the on-disk cache, the kernels used by ``resize``.
+
+    Kernels are compiled lazily on the first use of each energy mode, input
+    dtype and option. This runs every code path of ``resize``, including the
+    pyramid, multi-seam, expansion and object-removal ones, on small RGB and
+    grayscale images, as well as those of ``resize_frames`` and
+    ``resize_memmap``. Call it once in a fresh process, e.g. as a worker
+    initializer, to move that cost out of the first request, or at build time
+    with ``CARVE_CACHE_DIR`` set to prepopulate a cache directory to ship.
+
+    :param energy_modes: The energy modes to prepare kernels for.
+    :param dtypes: The image dtypes to prepare kernels for.
+    :return: The seconds spent importing numba and this module, as ``"import"``,
+        and the seconds spent per ``"<energy_mode>/<dtype>"`` combination.
+    """
+    timings = {"import": _IMPORT_SECONDS}
+    rng = np.random.default_rng(0)
+    for energy_mode in energy_modes:
+        for dtype in dtypes:
+            start = time.perf_counter()
+            for shape in ((24, 32, 3), (24, 32)):
+                src = rng.random(shape)
+                if np.dtype(dtype) == np.uint8:
+                    src = np.round(src * 255)
+                _warmup_calls(src.astype(dtype), energy_mode)
+            name = f"{energy_mode}/{np.dtype(dtype).name}"
+            timings[name] = time.perf_counter() - start
+    return timings
+
+
+def _submit(pool: Optional[ProcessPoolExecutor], fn: Callable, *args) -> Future:
+    """Run a function in the pool, or right away in this process without a pool"""
+    if pool is not None:
+        return pool.submit(fn, *args)
+    future = Future()
+    future.set_result(fn(*args))
+    return future
+
+
+def _carve_frames_pipelined(
+    chunks: List[np.ndarray],
+    passes: List[Tuple[int, bool]],
+    energy_mode: str,
+    band_width: int,
+    pool: Optional[ProcessPoolExecutor],
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Shrink chunks of frames by two passes, each seeded by the chunk before.
+
+    The first pass of a chunk runs along with the second pass of the chunk
+    before it.
+    """
+    first_args = passes[0] + (energy_mode, band_width)
+    second_args = passes[1] + (energy_mode, band_width)
+    first_seams = second_seams = None
+    results = []
+    # the frames and seconds of the chunk whose first pass is done
+    carved = None
+    for chunk in chunks + [None]:
+        first = second = None
+        if chunk is not None:
+            first = _submit(pool, _carve_frames, chunk, *first_args, first_seams)
+        if carved is not None:
+            second = _submit(pool, _carve_frames, carved[0], *second_args, second_seams)
+            frames, seconds, second_seams = second.result()
+            results.append((frames, carved[1] + seconds))
+            carved = None
+        if first is not None:
+            frames, seconds, first_seams = first.result()
+            carved = (frames, seconds)
+    return results
+
+
+def resize_frames(
+    frames: np.ndarray,
+    size: Tuple[int, int],
+    energy_mode: str = "backward",
+    order: str = "width-first",
+    band_width: int = 4,
+    chunk_size: int = 16,
+    max_workers: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Resize a stack of frames (video or burst photos) with temporal seam reuse.
+
+    The seams of each frame are searched only within ``band_width`` pixels of
+    the previous frame's seams, which is faster than a full search and keeps
+    seams temporally coherent. Only the first frame gets a full search. Frames
+    are carved in chunks by a process pool whose workers are warmed up for
+    ``energy_mode`` on startup, and each chunk is seeded with the seams of the
+    chunk before it. So the two passes are pipelined: one worker removes the
+    first dimension of a chunk while another removes the second dimension of the
+    chunk before. When expanding, frames are resized independently and chunks
+    are carved in parallel.
+
+    :param frames: A stack of frames in RGB or grayscale format, of shape
+        (N, H, W, C) or (N, H, W).
+    :param size: The target size in pixels, as a 2-tuple (width, height).
+        Frames are only warm-started when shrinking.
+    :param energy_mode: Policy to compute energy for the frames. Could be
+        one of ``backward`` or ``forward``.
+    :param order: The order to remove horizontal and vertical seams. Could be
+        one of ``width-first`` or ``height-first``.
+    :param band_width: The half width in pixels of the band searched around
+        the previous frame's seams.
+    :param chunk_size: The number of consecutive frames carved by one task.
+    :param max_workers: The maximum number of worker processes, at most 2 when
+        shrinking. If 1, all chunks are carved in the calling process. Workers
+        are spawned, so a script using them must guard its entry point with
+        ``if __name__ == "__main__":``.
+    :return: A 2-tuple of the resized frames and the seconds spent on each
+        frame, from which the per-frame throughput follows.
+    """
+    frames = np.asarray(frames)
+    if frames.size == 0 or frames.ndim not in (3, 4):
+        raise ValueError(
+            f"expect a 4d stack of rgb frames or a 3d stack of grayscale frames, "
+            f"got frames in shape {frames.shape}"
+        )
+    if energy_mode not in _list_enum(EnergyMode):
+        raise ValueError(
+            f"expect energy_mode to be one of {_list_enum(EnergyMode)}, got {energy_mode}"
+        )
+    fixed_orders = (OrderMode.WIDTH_FIRST.value, OrderMode.HEIGHT_FIRST.value)
+    if order not in fixed_orders:
+        raise ValueError(f"expect order to be one of {fixed_orders}, got {order}")
+
+    width, height = round(size[0]), round(size[1])
+    if width <= 0 or height <= 0:
+        raise ValueError(f"expect target size to be positive, got {size}")
+    if band_width < 1:
+        raise ValueError(f"expect `band_width` to be positive, got {band_width}")
+    if chunk_size < 1:
+        raise ValueError(f"expect `chunk_size` to be positive, got {chunk_size}")
+
+    chunks = [frames[i : i + chunk_size] for i in range(0, len(frames), chunk_size)]
+    expand = frames.shape[2] < width or frames.shape[1] < height
+    if not expand:
+        # the pipeline never runs more than two passes at a time
+        max_workers = min(max_workers or 2, 2)
+    pool = None
+    if max_workers != 1 and len(chunks) > 1:
+        # forked workers would inherit the threading layer of kernels already run
+        # here, which can leave this process hanging at exit under TBB
+        pool = ProcessPoolExecutor(
+            max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warmup,
+            initargs=((energy_mode,),),
+        )
+    try:
+        if expand:
+            args = (width, height, energy_mode, order)
+            if pool is None:
+                results = [_resize_frames(chunk, *args) for chunk in chunks]
+            else:
+                futures = [
+                    pool.submit(_resize_frames, chunk, *args) for chunk in chunks
+                ]
+                results = [future.result() for future in futures]
+        else:
+            passes = [(width, False), (height, True)]
+            if order == OrderMode.HEIGHT_FIRST:
+                passes.reverse()
+            results = _carve_frames_pipelined(
+                chunks, passes, energy_mode, band_width, pool
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    dst = np.concatenate([frames for frames, _ in results])
+    seconds = np.concatenate([seconds for _, seconds in results])
+    return dst, seconds
+
 
-    return src
\ No newline at end of file
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
@@ -0,0 +1,431 @@
+"""A local content-aware resize service with a result cache.
+
+The server runs ``carve.resize`` jobs in a pool of worker processes that are
+warmed up on startup, and keeps the results in an LRU cache keyed by a hash of
+the image content and the resize parameters. Identical requests that arrive
+while a job is running wait for that job instead of starting another one.
+
+It listens on a Unix socket or on a localhost TCP port. Each message is a JSON
+header, prefixed by its length as a 4-byte big-endian integer, followed by the
+arrays listed in ``header["arrays"]``, each in ``.npy`` format prefixed by its
+length as an 8-byte big-endian integer.
+
+Examples::
+
+    # start the server
+    python service.py --socket /tmp/carve.sock --workers 4
+
+    # from any process on the host
+    from service import ResizeClient
+    with ResizeClient(socket_path="/tmp/carve.sock") as client:
+        dst = client.resize(src, (640, 480), energy_mode="forward")
+        print(client.stats())
+"""
+
+import argparse
+import asyncio
+import hashlib
+import inspect
+import io
+import json
+import multiprocessing
+import os
+import socket
+import struct
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import carve
+
+# the keyword arguments of `carve.resize` accepted by the service
+RESIZE_PARAMS = (
+    "size",
+    "energy_mode",
+    "order",
+    "step_ratio",
+    "seams_per_pass",
+    "pyramid_levels",
+    "band_width",
+    "copies_per_seam",
+)
+RESIZE_MASKS = ("keep_mask", "drop_mask")
+RESIZE_DEFAULTS = {
+    name: param.default
+    for name, param in inspect.signature(carve.resize).parameters.items()
+    if name in RESIZE_PARAMS
+}
+
+
+def _encode_message(
+    header: Dict, arrays: Optional[Dict[str, np.ndarray]] = None
+) -> bytes:
+    """Serialize a header and the arrays that follow it"""
+    arrays = arrays or {}
+    header = dict(header, arrays=list(arrays))
+    payload = json.dumps(header).encode()
+    chunks = [struct.pack("!I", len(payload)), payload]
+    for arr in arrays.values():
+        buf = io.BytesIO()
+        np.save(buf, arr, allow_pickle=False)
+        chunks += [struct.pack("!Q", buf.tell()), buf.getvalue()]
+    return b"".join(chunks)
+
+
+def _decode_array(data: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+async def _read_message(
+    reader: asyncio.StreamReader,
+) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """Read a header and its arrays from a stream"""
+    (header_len,) = struct.unpack("!I", await reader.readexactly(4))
+    header = json.loads(await reader.readexactly(header_len))
+    arrays = {}
+    for name in header.get("arrays", []):
+        (size,) = struct.unpack("!Q", await reader.readexactly(8))
+        arrays[name] = _decode_array(await reader.readexactly(size))
+    return header, arrays
+
+
+def _get_cache_key(params: Dict, arrays: Dict[str, np.ndarray]) -> str:
+    """Hash the image content, the masks and the resize parameters"""
+    # requests that spell out a default value share the entry of those that omit it
+    params = {**RESIZE_DEFAULTS, **params}
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+    for name in sorted(arrays):
+        arr = np.ascontiguousarray(arrays[name])
+        digest.update(f"{name}:{arr.dtype.str}:{arr.shape}".encode())
+        digest.update(arr.data)
+    return digest.hexdigest()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _init_worker(energy_modes: Tuple[str, ...], ready) -> None:
+    """Compile the kernels of a worker, then report it on the `ready` queue"""
+    carve.warmup(energy_modes)
+    ready.put(os.getpid())
+
+
+def _resize_job(src: np.ndarray, kwargs: Dict) -> Tuple[np.ndarray, float]:
+    """Run a resize in a worker process and time it"""
+    start = time.perf_counter()
+    dst = carve.resize(src, **kwargs)
+    return dst, time.perf_counter() - start
+
+
+class ResultCache:
+    """An LRU cache of resized images bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        dst = self._entries.get(key)
+        if dst is not None:
+            self._entries.move_to_end(key)
+        return dst
+
+    def put(self, key: str, dst: np.ndarray) -> None:
+        if dst.nbytes > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = dst
+        self.num_bytes += dst.nbytes
+        while self.num_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.num_bytes -= evicted.nbytes
+
+
+class ResizeServer:
+    """Serve resize requests from a warm process pool and a result cache.
+
+    :param max_workers: The number of worker processes. If not specified, the
+        number of CPUs is used.
+    :param cache_bytes: The maximum total size of the cached results.
+    :param energy_modes: The energy modes to warm the workers up for.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        cache_bytes: int = 512 * 2**20,
+        energy_modes: Tuple[str, ...] = ("backward", "forward"),
+    ) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.energy_modes = energy_modes
+        self.cache = ResultCache(cache_bytes)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._ready = None
+        self._running: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.in_flight = 0
+
+    def start_pool(self) -> None:
+        # forked workers would inherit the threading layer of kernels already
+        # run here, which can leave this process hanging at exit under TBB
+        ctx = multiprocessing.get_context("spawn")
+        self._ready = ctx.Queue()
+        self._pool = ProcessPoolExecutor(
+            self.max_workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(self.energy_modes, self._ready),
+        )
+
+    async def warm_up(self) -> None:
+        """Start the workers and wait until the kernels of each one are ready"""
+        if self._pool is None:
+            self.start_pool()
+        loop = asyncio.get_running_loop()
+        # workers are spawned on demand, one per job submitted while none is
+        # idle, so these jobs start all of them. A fast worker may take several
+        # of the jobs, hence the wait for every initializer to report on its own
+        pings = [
+            loop.run_in_executor(self._pool, _ping) for _ in range(self.max_workers)
+        ]
+        for _ in range(self.max_workers):
+            await asyncio.to_thread(self._ready.get)
+        await asyncio.gather(*pings)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+            self._ready.close()
+            self._ready = None
+
+    def stats(self) -> Dict:
+        # coalesced requests waited for a running job, so they are not cache hits
+        lookups = self.hits + self.misses
+        return {
+            "queue_depth": max(0, self.in_flight - self.max_workers),
+            "in_flight": self.in_flight,
+            "workers": self.max_workers,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "cache_entries": len(self.cache),
+            "cache_bytes": self.cache.num_bytes,
+        }
+
+    async def resize(
+        self, params: Dict, arrays: Dict[str, np.ndarray]
+    ) -> Tuple[np.ndarray, bool]:
+        """Resize an image, returning the result and whether it was cached"""
+        unknown = set(params) - set(RESIZE_PARAMS)
+        if unknown:
+            raise ValueError(f"expect parameters in {RESIZE_PARAMS}, got {unknown}")
+        if "src" not in arrays:
+            raise ValueError("expect an image array named `src`")
+        key = await asyncio.to_thread(_get_cache_key, params, arrays)
+
+        dst = self.cache.get(key)
+        if dst is not None:
+            self.hits += 1
+            return dst, True
+        running = self._running.get(key)
+        if running is not None:
+            self.coalesced += 1
+            return await asyncio.shield(running), True
+
+        self.misses += 1
+        kwargs = dict(params)
+        if kwargs.get("size") is not None:
+            kwargs["size"] = tuple(kwargs["size"])
+        kwargs.update((name, arrays[name]) for name in RESIZE_MASKS if name in arrays)
+
+        if self._pool is None:
+            self.start_pool()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._running[key] = future
+        self.in_flight += 1
+        try:
+            dst, _ = await loop.run_in_executor(
+                self._pool, _resize_job, arrays["src"], kwargs
+            )
+        except Exception as e:
+            self.errors += 1
+            future.set_exception(e)
+            # mark the exception as retrieved if no other request waits for it
+            future.exception()
+            raise
+        else:
+            self.cache.put(key, dst)
+            future.set_result(dst)
+        finally:
+            self.in_flight -= 1
+            del self._running[key]
+        return dst, False
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the requests of a connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    header, arrays = await _read_message(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                op = header.get("op")
+                try:
+                    if op == "resize":
+                        start = time.perf_counter()
+                        dst, cached = await self.resize(
+                            header.get("params", {}), arrays
+                        )
+                        reply = _encode_message(
+                            {
+                                "ok": True,
+                                "cached": cached,
+                                "seconds": time.perf_counter() - start,
+                            },
+                            {"dst": dst},
+                        )
+                    elif op == "stats":
+                        reply = _encode_message({"ok": True, "stats": self.stats()})
+                    else:
+                        raise ValueError(
+                            f"expect op to be `resize` or `stats`, got {op}"
+                        )
+                except Exception as e:
+                    reply = _encode_message({"ok": False, "error": repr(e)})
+                writer.write(reply)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(
+        self, socket_path: Optional[str] = None, port: Optional[int] = None
+    ) -> None:
+        """Listen on a Unix socket, or on a localhost TCP port, until cancelled"""
+        try:
+            await self.warm_up()
+            if socket_path is not None:
+                server = await asyncio.start_unix_server(self.handle, socket_path)
+            else:
+                server = await asyncio.start_server(self.handle, "127.0.0.1", port)
+            async with server:
+                print(f"serving on {socket_path or f'127.0.0.1:{port}'}", flush=True)
+                await server.serve_forever()
+        finally:
+            self.shutdown()
+            if socket_path is not None and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+class ResizeClient:
+    """A blocking client of the resize service, for use from any process.
+
+    :param socket_path: The Unix socket of the server.
+    :param port: The localhost TCP port of the server, if no socket is given.
+    """
+
+    def __init__(
+        self, socket_path: Optional[str] = None, port: Optional[int] = None
+    ) -> None:
+        if socket_path is not None:
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.connect(socket_path)
+        elif port is not None:
+            self._sock = socket.create_connection(("127.0.0.1", port))
+        else:
+            raise ValueError("expect either `socket_path` or `port`")
+        self.last_reply: Dict = {}
+
+    def __enter__(self) -> "ResizeClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def _recv_exactly(self, size: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < size:
+            chunk = self._sock.recv(min(size - len(buf), 2**20))
+            if not chunk:
+                raise ConnectionError("the resize service closed the connection")
+            buf += chunk
+        return bytes(buf)
+
+    def _request(
+        self, header: Dict, arrays: Optional[Dict[str, np.ndarray]] = None
+    ) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        self._sock.sendall(_encode_message(header, arrays))
+        (header_len,) = struct.unpack("!I", self._recv_exactly(4))
+        reply = json.loads(self._recv_exactly(header_len))
+        out = {}
+        for name in reply.get("arrays", []):
+            (size,) = struct.unpack("!Q", self._recv_exactly(8))
+            out[name] = _decode_array(self._recv_exactly(size))
+        if not reply["ok"]:
+            raise RuntimeError(f"resize service error: {reply['error']}")
+        self.last_reply = reply
+        return reply, out
+
+    def resize(
+        self,
+        src: np.ndarray,
+        size: Optional[Tuple[int, int]] = None,
+        keep_mask: Optional[np.ndarray] = None,
+        drop_mask: Optional[np.ndarray] = None,
+        **params,
+    ) -> np.ndarray:
+        """Resize an image on the server. Accepts the arguments of ``carve.resize``"""
+        params["size"] = None if size is None else [int(x) for x in size]
+        arrays = {"src": np.asarray(src)}
+        if keep_mask is not None:
+            arrays["keep_mask"] = np.asarray(keep_mask, dtype=bool)
+        if drop_mask is not None:
+            arrays["drop_mask"] = np.asarray(drop_mask, dtype=bool)
+        _, out = self._request({"op": "resize", "params": params}, arrays)
+        return out["dst"]
+
+    def stats(self) -> Dict:
+        """Get the queue depth, hit rates and cache usage of the server"""
+        reply, _ = self._request({"op": "stats"})
+        return reply["stats"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local content-aware resize service")
+    parser.add_argument("--socket", help="path of the Unix socket to listen on")
+    parser.add_argument(
+        "--port", type=int, default=8765, help="localhost TCP port, if no socket"
+    )
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    parser.add_argument(
+        "--cache-mb", type=int, default=512, help="size of the result cache in MB"
+    )
+    args = parser.parse_args()
+
+    server = ResizeServer(args.workers, args.cache_mb * 2**20)
+    try:
+        asyncio.run(server.serve(args.socket, None if args.socket else args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
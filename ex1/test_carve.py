@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import carve
+
+IMAGE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "images", "palawan2.jpg"
+)
+
+
+@pytest.fixture(scope="module")
+def rgb() -> np.ndarray:
+    img = np.asarray(Image.open(IMAGE_PATH).convert("RGB"))
+    return np.ascontiguousarray(img[::4, ::4])
+
+
+def _get_input(rgb: np.ndarray, dtype: str) -> np.ndarray:
+    if dtype == "gray":
+        return np.ascontiguousarray(rgb[..., 1])
+    if dtype == "float32":
+        return rgb.astype(np.float32) / 255
+    return rgb
+
+
+@pytest.mark.parametrize("dtype", ["uint8", "gray", "float32"])
+@pytest.mark.parametrize("order", ["width-first", "height-first"])
+@pytest.mark.parametrize("energy_mode", ["backward", "forward"])
+def test_resize_memmap_matches_resize(rgb, tmp_path, energy_mode, order, dtype):
+    src = _get_input(rgb, dtype)
+    size = (src.shape[1] - 30, src.shape[0] - 20)
+    # tiles smaller than the image, so that the transposes are streamed
+    dst = carve.resize_memmap(
+        src, str(tmp_path / "dst.npy"), size, energy_mode, order, chunk_rows=17
+    )
+    expected = carve.resize(src, size, energy_mode, order)
+    assert dst.shape == expected.shape
+    np.testing.assert_array_equal(dst, expected)
+
+
+@pytest.fixture(scope="module")
+def frames(rgb) -> np.ndarray:
+    # a slow pan, so that the seams of consecutive frames are close
+    return np.stack([np.roll(rgb, i, axis=1)[:, 10:190] for i in range(12)])
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+@pytest.mark.parametrize("order", ["width-first", "height-first"])
+@pytest.mark.parametrize("energy_mode", ["backward", "forward"])
+def test_resize_frames_chunks_match_one_chain(frames, energy_mode, order, max_workers):
+    size = (frames.shape[2] - 25, frames.shape[1] - 15)
+    expected, _ = carve.resize_frames(
+        frames, size, energy_mode, order, chunk_size=len(frames), max_workers=1
+    )
+    dst, seconds = carve.resize_frames(
+        frames, size, energy_mode, order, chunk_size=5, max_workers=max_workers
+    )
+    assert seconds.shape == (len(frames),)
+    np.testing.assert_array_equal(dst, expected)
+
+
+def test_u8_energy_decodes_to_float_energy(rgb):
+    gray = carve._rgb2gray(rgb)
+    energy = carve._get_energy(gray)
+    assert energy.dtype == np.int16
+    expected = carve._get_energy(gray.astype(np.float32))
+    np.testing.assert_array_equal(carve._get_energy_values(energy)[energy], expected)
+
+
+@pytest.mark.parametrize("op", ["shrink", "expand", "keep"])
+def test_u8_backward_resize_matches_float_energy(rgb, monkeypatch, op):
+    h, w = rgb.shape[:2]
+    kwargs = {"size": (w - 40, h - 20) if op != "expand" else (w + 30, h)}
+    if op == "keep":
+        keep_mask = np.zeros((h, w), dtype=bool)
+        keep_mask[: h // 2, : w // 3] = True
+        kwargs["keep_mask"] = keep_mask
+    dst = carve.resize(rgb, **kwargs)
+    # carve the same 8-bit gray image from a float energy map
+    monkeypatch.setattr(
+        carve,
+        "_get_energy",
+        lambda gray: carve._get_energy_kernel(gray.astype(np.float32)),
+    )
+    np.testing.assert_array_equal(dst, carve.resize(rgb, **kwargs))
@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pytest
+
+import utils
+
+EX1_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(autouse=True)
+def in_ex1_dir(monkeypatch):
+    # object masks are looked up in images/obj_masks, relative to the working directory
+    monkeypatch.chdir(EX1_DIR)
+
+
+def _check_updates_match_recompute(img: utils.VerticalSeamImage, num_seams: int):
+    """Remove seams one by one, comparing the updated matrices to a full recompute"""
+    img.is_removing_vertical = True
+    img.init_mats()
+    for _ in range(num_seams):
+        seam = img.backtrack_seam()
+        img.seam_history.append(seam)
+        img.remove_seam()
+        img.update_mats(seam)
+        updated = (img.E.copy(), img.M.copy(), img.backtrack_mat.copy())
+        img.init_mats()
+        for name, mat, expected in zip(
+            ("E", "M", "backtrack_mat"), updated, (img.E, img.M, img.backtrack_mat)
+        ):
+            np.testing.assert_array_equal(mat, expected, err_msg=name)
+        img.E, img.M, img.backtrack_mat = updated
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_update_mats_matches_recompute(dtype):
+    img = utils.VerticalSeamImage("images/palawan2.jpg", vis_seams=False, dtype=dtype)
+    _check_updates_match_recompute(img, 20)
+
+
+def test_update_mats_matches_recompute_with_masks():
+    img = utils.SCWithObjRemoval(
+        active_masks=["Gemma"], img_path="images/llamas.png", vis_seams=False
+    )
+    _check_updates_match_recompute(img, 15)
+
+
+def test_reinit_restores_the_original_image():
+    img = utils.VerticalSeamImage("images/palawan2.jpg", vis_seams=False)
+    expected = (img.E.copy(), img.M.copy(), img.backtrack_mat.copy())
+    img.seams_removal_vertical(5)
+    img.reinit()
+    assert img.resized_rgb.shape == img.rgb.shape
+    img.init_mats()
+    for mat, expected_mat in zip((img.E, img.M, img.backtrack_mat), expected):
+        np.testing.assert_array_equal(mat, expected_mat)
+
+    plain = utils.SeamImage("images/palawan2.jpg", vis_seams=False)
+    plain.reinit()
+    np.testing.assert_array_equal(plain.E, expected[0])
+
+
+def test_reinit_rejects_unknown_masks():
+    img = utils.SCWithObjRemoval(
+        active_masks=["Gemma"], img_path="images/llamas.png", vis_seams=False
+    )
+    with pytest.raises(ValueError):
+        img.reinit(["Jurassic"])
+    assert img.active_masks == ["Gemma"]
+    img.reinit(["Vicuna"])
+    assert list(img.obj_coords) == ["Vicuna"]
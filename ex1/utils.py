@@ -5,6 +5,12 @@ from tqdm import tqdm
 from abc import abstractmethod, abstractstaticmethod
 from os.path import basename
 import functools
+import hashlib
+import os
+import tracemalloc
+
+# directory of the decoded images cache of SeamImage.load_image, disabled if not set
+IMAGE_CACHE_ENV = 'SEAM_IMAGE_CACHE'
 
 
 def NI_decor(fn):
@@ -18,25 +24,38 @@ def NI_decor(fn):
 
 
 class SeamImage:
-    def __init__(self, img_path, vis_seams=True):
+    def __init__(self, img_path, vis_seams=True, dtype=np.float32, profile_memory=False):
         """ SeamImage initialization.
 
         Parameters:
             img_path (str): image local path
             method (str) (a or b): a for Hard Vertical and b for the known Seam Carving algorithm
             vis_seams (bool): if true, another version of the original image shall be store, and removed seams should be marked on it
+            dtype (np.dtype): precision of the grayscale image and of everything derived from it (E, M).
+                float64 doubles their memory
+            profile_memory (bool): starts tracemalloc, so that the peak memory of every stage is recorded in
+                self.memory_peaks (see end_stage)
         """
+        if profile_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # the peak traced memory and the bytes of the instance's arrays of every stage, see end_stage
+        self.memory_peaks = {}
+        self.array_bytes = {}
+        self.start_stage()
+
         #################
         # Do not change #
         #################
         self.path = img_path
 
-        self.gs_weights = np.array([[0.299, 0.587, 0.114]]).T
+        self.dtype = np.dtype(dtype)
+        self.gs_weights = np.array([[0.299, 0.587, 0.114]], dtype=self.dtype).T
 
         self.rgb = self.load_image(img_path)
         self.resized_rgb = self.rgb.copy()
 
         self.vis_seams = vis_seams
+        self.seam_log = []
         if vis_seams:
             self.seams_rgb = self.rgb.copy()
 
@@ -45,7 +64,8 @@ class SeamImage:
         try:
             self.gs = self.rgb_to_grayscale(self.rgb)
             self.resized_gs = self.gs.copy()
-            self.cumm_mask = np.ones_like(self.gs, dtype=bool)
+            if vis_seams:
+                self.cumm_mask = np.ones_like(self.gs, dtype=bool)
         except NotImplementedError as e:
             print(e)
 
@@ -56,11 +76,15 @@ class SeamImage:
         #################
 
         # additional attributes you might find useful
+        # self.seam_log holds the original (y, x) coordinates of every removed seam as a (2, n) int32
+        # array, and is painted on seams_rgb when it is read
         self.seam_history = []
         self.seam_balance = 0
 
-        # This might serve you to keep tracking original pixel indices 
-        self.idx_map_h, self.idx_map_v = np.meshgrid(range(self.w), range(self.h))
+        # The original flat index (y * w + x) of every pixel of the resized image. It is compacted together
+        # with the image when a seam is removed, see get_original_coords
+        self.idx_map = np.arange(self.h * self.w, dtype=np.int32).reshape(self.h, self.w)
+        self.cache_base_mats()  # -> subclasses cache again once they computed M
 
     def rgb_to_grayscale(self, np_img):
         """ Converts a np RGB image into grayscale (using self.gs_weights).
@@ -111,22 +135,68 @@ class SeamImage:
         pass
 
     def rotate_mats(self, clockwise):
+        """ Rotates the resized image and its index map by 90 degrees.
+
+        The rotated matrices are copied once into contiguous row-major buffers, so that all the seams of a
+        batch are carved on contiguous rows instead of strided views.
+        """
         dir = -1 if clockwise else 1
-        
+
         self.h, self.w = self.w, self.h
-        self.resized_gs = np.rot90(self.resized_gs, dir)
-        self.resized_rgb = np.rot90(self.resized_rgb, dir)
-        self.seams_rgb = np.rot90(self.seams_rgb, dir)
-        self.idx_map_h = np.rot90(self.idx_map_h, dir)
-        self.idx_map = np.rot90(self.idx_map , dir)
-        self.idx_map_v = np.rot90(self.idx_map_v, -dir)
+        self.resized_gs = np.ascontiguousarray(np.rot90(self.resized_gs, dir))
+        self.resized_rgb = np.ascontiguousarray(np.rot90(self.resized_rgb, dir))
+        self.idx_map = np.ascontiguousarray(np.rot90(self.idx_map, dir))
+        self.base_mats_ready = False  # -> the cached matrices are in the original orientation
+
+    def get_original_coords(self, rows=None, cols=None):
+        """ Returns the original coordinates of pixels of the resized image.
+
+        Parameters:
+            rows, cols (np.ndarray): indices of pixels in the resized image (in its current orientation).
+                If not given, the coordinates of all pixels are returned
+
+        Returns:
+            the original (y, x) coordinates, as two int32 arrays
+        """
+        flat = self.idx_map if rows is None else self.idx_map[rows, cols]
+        return np.divmod(flat, np.int32(self.rgb.shape[1]))
+
+    @property
+    def idx_map_h(self):
+        """ The original column of every pixel of the resized image """
+        return self.get_original_coords()[1]
+
+    @property
+    def idx_map_v(self):
+        """ The original row of every pixel of the resized image """
+        return self.get_original_coords()[0]
+
+    @property
+    def seams_rgb(self):
+        """ The original image with the removed seams painted in red. Seams are painted lazily, in one pass
+        over all seams removed since the last read.
+        """
+        if self.seam_log:
+            ys, xs = np.concatenate(self.seam_log, axis=1)
+            self.seam_log = []
+            self.cumm_mask[ys, xs] = False
+            self._seams_rgb[ys, xs] = (1, 0, 0)
+        return self._seams_rgb
+
+    @seams_rgb.setter
+    def seams_rgb(self, seams_rgb):
+        self._seams_rgb = seams_rgb
 
     def init_mats(self):
         pass
 
+    def update_mats(self, seam):
+        pass
+
     def update_ref_mat(self):
-        for i, s in enumerate(self.seam_history[-1]):
-            self.idx_map[i, s:] += 1
+        """ The index map is compacted together with the image in remove_seam
+        """
+        pass
 
     def backtrack_seam(self):
         pass
@@ -134,14 +204,104 @@ class SeamImage:
     def remove_seam(self):
         pass
 
+    def cache_base_mats(self):
+        """ Keeps the matrices computed for the original image, so that reinit does not compute them again.
+        They are never written in place, init_mats copies them before a batch of seams is removed.
+        """
+        self.base_mats = {name: getattr(self, name) for name in ('E', 'M', 'backtrack_mat') if hasattr(self, name)}
+        self.base_mats_ready = True
+
     def reinit(self):
-        """ re-initiates instance
+        """ re-initiates instance, without decoding the image or computing its matrices again
         """
-        self.__init__(img_path=self.path)
+        self.start_stage()
+        self.h, self.w = self.rgb.shape[:2]
+        self.resized_rgb = self.rgb.copy()
+        self.resized_gs = self.gs.copy()
+        self.seam_log = []
+        if self.vis_seams:
+            self.cumm_mask = np.ones_like(self.gs, dtype=bool)
+            self.seams_rgb = self.rgb.copy()
+        self.seam_history = []
+        self.seam_balance = 0
+        self.idx_map = np.arange(self.h * self.w, dtype=np.int32).reshape(self.h, self.w)
+        for name, mat in self.base_mats.items():
+            setattr(self, name, mat)
+        self.base_mats_ready = True
+        self.end_stage('reinit')
+
+    def start_stage(self):
+        """ Starts measuring the peak memory of a stage, see end_stage
+        """
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def end_stage(self, stage):
+        """ Records the memory of the stage that just ended, keeping the maximum over all its runs:
+            - self.memory_peaks[stage]: the high-water mark of the memory traced by tracemalloc since start_stage,
+              temporaries included. Only recorded while tracemalloc is tracing (see profile_memory). It covers
+              the whole process, and every numpy buffer, but not allocations made inside compiled kernels
+            - self.array_bytes[stage]: the bytes held by the arrays of the instance at the end of the stage.
+              Views are counted once, by the size of the buffer they view
+
+        Parameters:
+            stage (str): the stage that just ended
+        """
+        if tracemalloc.is_tracing():
+            self.memory_peaks[stage] = max(self.memory_peaks.get(stage, 0), tracemalloc.get_traced_memory()[1])
+
+        buffers = {}
+
+        def add(obj):
+            if isinstance(obj, np.ndarray):
+                while isinstance(obj.base, np.ndarray):
+                    obj = obj.base
+                buffers[id(obj)] = obj.nbytes
+            elif isinstance(obj, (list, tuple)):
+                for item in obj:
+                    add(item)
+            elif isinstance(obj, dict):
+                add(list(obj.values()))
+
+        add(list(vars(self).values()))
+        self.array_bytes[stage] = max(self.array_bytes.get(stage, 0), sum(buffers.values()))
 
     @staticmethod
-    def load_image(img_path, format='RGB'):
-        return np.asarray(Image.open(img_path).convert(format)).astype('float32') / 255.0
+    def load_image(img_path, format='RGB', draft_size=None, cache_dir=None):
+        """ Loads an image as a float32 array in [0, 1].
+
+        Parameters:
+            img_path (str): image local path
+            format (str): PIL mode to convert the image to
+            draft_size (tuple): (w, h) the image is needed at. JPEGs are then decoded at the smallest
+                power-of-two reduced scale that is still at least that large
+            cache_dir (str): directory of decoded arrays, keyed by the path, mtime, format and draft size.
+                Cached images are loaded as read-only memory maps. Defaults to $SEAM_IMAGE_CACHE
+
+        Returns:
+            the image, of shape (h, w, 3) for RGB and (h, w) for L
+        """
+        cache_dir = cache_dir if cache_dir is not None else os.environ.get(IMAGE_CACHE_ENV)
+        if cache_dir:
+            path = os.path.abspath(img_path)
+            key = repr((path, os.stat(path).st_mtime_ns, format, draft_size))
+            cache_path = os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.npy')
+            if os.path.exists(cache_path):
+                return np.load(cache_path, mmap_mode='r')
+
+        img = Image.open(img_path)
+        if draft_size is not None:
+            img.draft(format, tuple(draft_size))  # -> does nothing for formats other than JPEG
+        img = np.asarray(img.convert(format)).astype('float32') / 255.0
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, img)
+            os.replace(tmp_path, cache_path)  # -> concurrent loaders never read a partial file
+            return np.load(cache_path, mmap_mode='r')
+        return img
 
 
 class VerticalSeamImage(SeamImage):
@@ -153,6 +313,8 @@ class VerticalSeamImage(SeamImage):
             self.M = self.calc_M()
         except NotImplementedError as e:
             print(e)
+        self.cache_base_mats()
+        self.end_stage('init')
 
     # @NI_decor
     def calc_M(self):
@@ -163,34 +325,53 @@ class VerticalSeamImage(SeamImage):
 
         Guidelines & hints:
             As taught, the energy is calculated from top to bottom.
-            You might find the function 'np.roll' useful.
+            The backtracking matrix is filled in the same pass (see calc_M_bt).
         """
-        M = np.copy(self.E)
-
-        V = np.roll(self.resized_gs, 1, axis=0)
-        L = np.roll(self.resized_gs, 1, axis=1)
-        R = np.roll(self.resized_gs, -1, axis=1)
-        V[0,:] = 0
-        L[:,0] = 0
-        R[:,-1] = 0
-
-        C_V = np.abs(R - L)
-        C_L = np.abs(V - L) + C_V
-        C_R = np.abs(V - R) + C_V
-
-        for i in range(1, self.h):
-            M_V = M[i - 1]
-            M_L = np.roll(M_V, 1)
-            M_L[0] = np.inf
-
-            M_R = np.roll(M_V, -1)
-            M_R[-1] = np.inf
-
-            costs = np.array([M_L, M_V, M_R]) + np.array([C_L[i], C_V[i], C_R[i]])
+        M = np.empty_like(self.E)
+        self.backtrack_mat = np.zeros_like(M, dtype=np.int8)  # -> holds offsets in {-1, 0, 1}
+        self.calc_M_bt(self.E[:, :, 0], self.resized_gs[:, :, 0], M[:, :, 0],
+                       self.backtrack_mat[:, :, 0])
+        return M
 
-            M[i] = np.min(costs, axis=0) + self.E[i]
+    @staticmethod
+    @jit(nopython=True, cache=True)
+    def calc_M_bt(E, gs, M, backtrack_mat):
+        """ Fills the forward-looking cost matrix M and the back-tracking matrix in a single pass.
 
-        return M
+        Parameters:
+            E: np.ndarray of shape (h,w): the gradient magnitude
+            gs: np.ndarray of shape (h,w): the grayscale image
+            M: np.ndarray of shape (h,w): to be filled here
+            backtrack_mat: np.ndarray (int8) of shape (h,w): to be filled here with the
+                column offset (-1, 0 or 1) of the parent of every pixel in the row above
+        """
+        h, w = E.shape
+        M[0] = E[0]
+        for i in range(1, h):
+            for j in range(w):
+                left = gs[i, j - 1] if j > 0 else 0.0
+                right = gs[i, j + 1] if j < w - 1 else 0.0
+                up = gs[i - 1, j]
+                c_v = abs(right - left)
+
+                # ties are broken left, middle, right, like np.argmin
+                best = np.inf
+                offset = 0
+                if j > 0:
+                    best = M[i - 1, j - 1] + (abs(up - left) + c_v)
+                    offset = -1
+                cost = M[i - 1, j] + c_v
+                if cost < best:
+                    best = cost
+                    offset = 0
+                if j < w - 1:
+                    cost = M[i - 1, j + 1] + (abs(up - right) + c_v)
+                    if cost < best:
+                        best = cost
+                        offset = 1
+
+                M[i, j] = best + E[i, j]
+                backtrack_mat[i, j] = offset
 
 
     # @NI_decor
@@ -218,31 +399,141 @@ class VerticalSeamImage(SeamImage):
             - removing seams couple of times (call the function more than once)
             - visualize the original image with removed seams marked (for comparison)
         """
+        self.start_stage()
+        self.init_mats()
+        self.end_stage('init_mats')
+        self.start_stage()
         for _ in range(num_remove):
-            self.init_mats()
-            self.calc_bt_mat(self.M, self.E, self.resized_gs, self.backtrack_mat)
             seam = self.backtrack_seam()
             self.seam_history.append(seam)
-            self.update_ref_mat()
+            self.paint_seam()  # -> before the index map is compacted
             self.remove_seam()
-            self.paint_seam()
+            self.update_mats(seam)
+        self.end_stage('removal')
 
     def paint_seam(self):
-        (idx_map_y, idx_map_x) = (self.idx_map_v, self.idx_map_h) if self.is_removing_vertical else (self.idx_map_h, self.idx_map_v)
-
+        """ Logs the original coordinates of the last seam, to be painted when seams_rgb is read.
+        Does nothing if vis_seams is False.
+        """
+        if not self.vis_seams:
+            return
         seam = self.seam_history[-1]
-        for i, s_i in enumerate(seam):
-            self.cumm_mask[idx_map_y[i, s_i], idx_map_x[i, s_i]] = False
-            
-        cumm_mask_rgb = np.stack([self.cumm_mask] * 3, axis=2)
-        cumm_mask_rgb = cumm_mask_rgb.squeeze()
-        self.seams_rgb = np.where(cumm_mask_rgb, self.seams_rgb, [1, 0, 0])
+        self.seam_log.append(np.array(self.get_original_coords(np.arange(len(seam)), seam), dtype=np.int32))
 
     def init_mats(self):
-        self.E = self.calc_gradient_magnitude()
-        self.M = self.calc_M()
-        self.backtrack_mat = np.zeros_like(self.M, dtype=int)
-        self.mask = np.ones_like(self.M, dtype=bool).squeeze()
+        if self.base_mats_ready:  # -> the image was not carved yet, copy the cached matrices
+            self.E = self.base_mats['E'].copy()
+            self.M = self.base_mats['M'].copy()
+            self.backtrack_mat = self.base_mats['backtrack_mat'].copy()
+            self.base_mats_ready = False
+        else:
+            self.E = self.calc_gradient_magnitude()
+            self.M = self.calc_M()  # -> also fills self.backtrack_mat
+        self.mask = np.ones((self.h, self.w), dtype=bool)  # -> allocated once per batch, see update_mats
+
+    def update_mats(self, seam):
+        """ Updates E, M and the backtracking matrix after a seam was removed, instead of recomputing them.
+
+        The matrices are shrunk in place. Removing a seam only changes the gradient of the pixels next to
+        it, so E is recomputed in a narrow band around the seam, and M in the cone below the pixels whose
+        cost actually changed.
+
+        Parameters:
+            seam (np.ndarray): the column of the removed seam in every row, before the removal
+        """
+        for mat in (self.E, self.M, self.backtrack_mat):
+            self.remove_seam_inplace(mat[:, :, 0], seam)
+        self.E = self.E[:, :-1]
+        self.M = self.M[:, :-1]
+        self.backtrack_mat = self.backtrack_mat[:, :-1]
+
+        self.update_E_band(self.E[:, :, 0], self.resized_gs[:, :, 0], seam)
+        self.update_band_hook(seam)
+        self.update_M_bt(self.E[:, :, 0], self.resized_gs[:, :, 0], self.M[:, :, 0],
+                         self.backtrack_mat[:, :, 0], seam)
+        self.mask[np.arange(self.h), seam] = True  # -> only the seam was cleared, reset it in place
+        self.mask = self.mask[:, :self.w]
+
+    def update_band_hook(self, seam):
+        """ Called after E was recomputed in the band of columns [seam - 2, seam + 1] around a removed seam
+        """
+        pass
+
+    @staticmethod
+    @jit(nopython=True, cache=True)
+    def remove_seam_inplace(mat, seam):
+        """ Shifts every row of mat left over the seam pixel. The last column is left stale.
+        """
+        h, w = mat.shape
+        for i in range(h):
+            for j in range(seam[i], w - 1):
+                mat[i, j] = mat[i, j + 1]
+
+    @staticmethod
+    @jit(nopython=True, cache=True)
+    def update_E_band(E, gs, seam):
+        """ Recomputes the gradient magnitude (as in calc_gradient_magnitude) in the columns
+        [seam - 2, seam + 1] of every row, which covers all pixels whose neighbors changed.
+        """
+        h, w = E.shape
+        zero = gs.dtype.type(0)  # -> computes in the precision of gs, like calc_gradient_magnitude
+        for i in range(h):
+            for j in range(max(seam[i] - 2, 0), min(seam[i] + 2, w)):
+                dx = (gs[i + 1, j] if i < h - 1 else zero) - gs[i, j]
+                dy = (gs[i, j + 1] if j < w - 1 else zero) - gs[i, j]
+                E[i, j] = min(max(np.sqrt(dx * dx + dy * dy), 0.0), 1.0)
+
+    @staticmethod
+    @jit(nopython=True, cache=True)
+    def update_M_bt(E, gs, M, backtrack_mat, seam):
+        """ Updates M and the backtracking matrix (as in calc_M_bt) after a seam was removed.
+
+        In every row, the pixels near the seam and below the pixels whose cost changed in the previous row
+        are recomputed. All other pixels keep their shifted values.
+        """
+        h, w = E.shape
+        dirty_lo, dirty_hi = w, -1
+        for i in range(h):
+            prev_s = seam[i - 1] if i > 0 else seam[0]
+            lo = min(seam[i], prev_s) - 2
+            hi = max(seam[i], prev_s) + 1
+            if dirty_hi >= 0:
+                lo = min(lo, dirty_lo - 1)
+                hi = max(hi, dirty_hi + 1)
+            dirty_lo, dirty_hi = w, -1
+
+            for j in range(max(lo, 0), min(hi + 1, w)):
+                if i == 0:
+                    best = E[0, j]
+                    offset = 0
+                else:
+                    left = gs[i, j - 1] if j > 0 else 0.0
+                    right = gs[i, j + 1] if j < w - 1 else 0.0
+                    up = gs[i - 1, j]
+                    c_v = abs(right - left)
+
+                    best = np.inf
+                    offset = 0
+                    if j > 0:
+                        best = M[i - 1, j - 1] + (abs(up - left) + c_v)
+                        offset = -1
+                    cost = M[i - 1, j] + c_v
+                    if cost < best:
+                        best = cost
+                        offset = 0
+                    if j < w - 1:
+                        cost = M[i - 1, j + 1] + (abs(up - right) + c_v)
+                        if cost < best:
+                            best = cost
+                            offset = 1
+                    best += E[i, j]
+
+                old = M[i, j]
+                M[i, j] = best
+                if M[i, j] != old:  # -> compared once rounded to the precision of M
+                    dirty_lo = min(dirty_lo, j)
+                    dirty_hi = max(dirty_hi, j)
+                backtrack_mat[i, j] = offset
 
     # @NI_decor
     def seams_removal_horizontal(self, num_remove):
@@ -252,7 +543,6 @@ class VerticalSeamImage(SeamImage):
             num_remove (int): number of horizontal seam to be removed
         """
         self.is_removing_vertical = False
-        self.idx_map = self.idx_map_v
         self.rotate_mats(clockwise=True)
         self.seams_removal(num_remove)
         self.rotate_mats(clockwise=False)
@@ -266,7 +556,6 @@ class VerticalSeamImage(SeamImage):
             num_remove (int): umber of vertical seam to be removed
         """
         self.is_removing_vertical = True
-        self.idx_map = self.idx_map_h
         self.seams_removal(num_remove)
         self.seam_history = []
 
@@ -282,7 +571,7 @@ class VerticalSeamImage(SeamImage):
             self.mask[i, j] = False
             j += self.backtrack_mat[i, j][0]
 
-        return np.array(seam)
+        return np.array(seam[::-1])  # -> top row first
 
     # @NI_decor
     def remove_seam(self):
@@ -292,11 +581,24 @@ class VerticalSeamImage(SeamImage):
         In order to apply the removal, you might want to extend the seam mask to support 3 channels (rgb) using: 3d_mak = np.stack([1d_mask] * 3, axis=2), and then use it to create a resized version.
         """
         self.w -= 1
-        rgb_mask = np.stack([self.mask] * 3, axis=2).squeeze()
+        self.remove_seam_kernel(self.resized_rgb, self.resized_gs, self.idx_map, self.seam_history[-1])
+        self.resized_rgb = self.resized_rgb[:, :self.w]
+        self.resized_gs = self.resized_gs[:, :self.w]
+        self.idx_map = self.idx_map[:, :self.w]
 
-        self.resized_gs = self.resized_gs[self.mask].reshape((self.h, self.w, 1))
-        self.resized_rgb = self.resized_rgb[rgb_mask].reshape((self.h, self.w, 3))
-        self.mask = self.mask.squeeze()
+    @staticmethod
+    @jit(nopython=True, cache=True)
+    def remove_seam_kernel(rgb, gs, idx_map, seam):
+        """ Shifts every row of the image, its grayscale and its index map left over the seam pixel, in place.
+        The last column is left stale.
+        """
+        h, w, c = rgb.shape
+        for i in range(h):
+            for j in range(seam[i], w - 1):
+                for k in range(c):
+                    rgb[i, j, k] = rgb[i, j + 1, k]
+                gs[i, j, 0] = gs[i, j + 1, 0]
+                idx_map[i, j] = idx_map[i, j + 1]
 
     # @NI_decor
     def seams_addition(self, num_add: int):
@@ -368,8 +670,11 @@ class SCWithObjRemoval(VerticalSeamImage):
         """
         super().__init__(*args, **kwargs)
         self.active_masks = active_masks
-        self.obj_masks = {basename(img_path)[:-4]: self.load_image(img_path, format='L') for img_path in
-                          glob.glob('images/obj_masks/*')}
+        # masks are decoded only once they are activated, and kept bit-packed (see load_obj_mask)
+        self.obj_mask_paths = {basename(img_path)[:-4]: img_path for img_path in glob.glob('images/obj_masks/*')}
+        self.packed_obj_masks = {}
+        # the (y, x) coordinates of the pixels of every active mask in the resized image, as (2, n) int32 arrays
+        self.obj_coords = {}
         self.mask_constant = 1000
         try:
             self.preprocess_masks()
@@ -380,6 +685,7 @@ class SCWithObjRemoval(VerticalSeamImage):
             self.M = self.calc_M()
         except NotImplementedError as e:
             print(e)
+        self.end_stage('init')
 
     def preprocess_masks(self):
         """ Mask preprocessing.
@@ -388,10 +694,39 @@ class SCWithObjRemoval(VerticalSeamImage):
             Guidelines & hints:
                 - for every active mask we need make it binary: {0,1}
         """
+        self.obj_coords = {}
         for mask in self.active_masks:
-            self.obj_masks[mask] = np.round(self.obj_masks[mask]).astype(bool)
+            packed, (y0, y1, x0, x1) = self.load_obj_mask(mask)
+            ys, xs = np.nonzero(np.unpackbits(packed, count=(y1 - y0) * (x1 - x0)).reshape(y1 - y0, x1 - x0))
+            self.obj_coords[mask] = np.array([ys + y0, xs + x0], dtype=np.int32)
         print('Active masks:', self.active_masks)
 
+    def load_obj_mask(self, name):
+        """ Decodes a mask once, and keeps it binary and bit-packed within its bounding box
+
+        Parameters:
+            name (str): the mask name, the file name in images/obj_masks without its extension
+
+        Returns:
+            the packed mask and its bounding box (y0, y1, x0, x1) in the original image
+        """
+        if name not in self.packed_obj_masks:
+            mask = np.round(self.load_image(self.obj_mask_paths[name], format='L')).astype(bool)
+            ys, xs = np.nonzero(mask)
+            bbox = (ys.min(), ys.max() + 1, xs.min(), xs.max() + 1) if len(ys) else (0, 0, 0, 0)
+            self.packed_obj_masks[name] = (np.packbits(mask[bbox[0]:bbox[1], bbox[2]:bbox[3]]), bbox)
+        return self.packed_obj_masks[name]
+
+    @property
+    def obj_masks(self):
+        """ The active masks as dense boolean images of the shape of the resized image
+        """
+        masks = {}
+        for k, (ys, xs) in self.obj_coords.items():
+            masks[k] = np.zeros((self.h, self.w), dtype=bool)
+            masks[k][ys, xs] = True
+        return masks
+
     # @NI_decor
     def apply_mask(self):
         """ Applies all active masks on the image
@@ -400,32 +735,59 @@ class SCWithObjRemoval(VerticalSeamImage):
                 - you need to apply the masks on other matrices!
                 - think how to force seams to pass through a mask's object..
         """
-        for k in self.active_masks:
-            if k not in self.obj_masks:
-                continue
-            mask = self.obj_masks[k]
-            self.E[mask] = -self.mask_constant
+        for ys, xs in self.obj_coords.values():
+            self.E[ys, xs] = -self.mask_constant
 
     def init_mats(self):
-        self.E = self.calc_gradient_magnitude()
+        if self.base_mats_ready:
+            self.E = self.base_mats['E'].copy()
+            self.base_mats_ready = False
+        else:
+            self.E = self.calc_gradient_magnitude()
         self.apply_mask()  # -> added
-        self.M = self.calc_M()
-        self.backtrack_mat = np.zeros_like(self.M, dtype=int)
-        self.mask = np.ones_like(self.M, dtype=bool)
+        self.M = self.calc_M()  # -> also fills self.backtrack_mat
+        self.mask = np.ones((self.h, self.w), dtype=bool)
 
-    def reinit(self, active_masks):
-        """ re-initiates instance
+    def update_band_hook(self, seam):
+        """ Re-applies the active masks on the band of E that was recomputed
         """
-        self.__init__(active_masks=active_masks, img_path=self.path)
+        for ys, xs in self.obj_coords.values():
+            dist = xs - seam[ys]
+            band = (dist >= -2) & (dist <= 1)  # -> the columns [s-2, s+1] of update_E_band
+            self.E[ys[band], xs[band]] = -self.mask_constant
+
+    def reinit(self, active_masks=None):
+        """ re-initiates instance, without decoding the image and the masks again
+
+        Parameters:
+            active_masks (list): the masks to remove. If not given, the current ones are kept
+        """
+        if active_masks is None:
+            active_masks = self.active_masks
+        unknown = set(active_masks) - set(self.obj_mask_paths)
+        if unknown:  # -> checked before the instance is changed
+            raise ValueError(f"expect masks in {sorted(self.obj_mask_paths)}, got {sorted(unknown)}")
+        self.active_masks = active_masks
+        self.preprocess_masks()
+        super().reinit()
+
+    def rotate_mats(self, clockwise):
+        """ A wrapper for super.rotate_mats method. rotates the active masks with the image.
+        """
+        h, w = self.h, self.w
+        super().rotate_mats(clockwise)
+        for k, (ys, xs) in self.obj_coords.items():
+            self.obj_coords[k] = np.array([xs, h - 1 - ys] if clockwise else [w - 1 - xs, ys], dtype=np.int32)
 
     def remove_seam(self):
         """ A wrapper for super.remove_seam method. takes care of the masks.
         """
         super().remove_seam()
-        for k in self.active_masks:
-            if k not in self.obj_masks:
-                continue
-            self.obj_masks[k] = self.obj_masks[k][self.mask].reshape(self.h, self.w)
+        seam = self.seam_history[-1]
+        for k, (ys, xs) in self.obj_coords.items():
+            s = seam[ys]
+            keep = xs != s
+            self.obj_coords[k] = np.array([ys[keep], xs[keep] - (xs[keep] > s[keep])], dtype=np.int32)
 
 
 def scale_to_shape(orig_shape: np.ndarray, scale_factors: list):
@@ -453,7 +815,7 @@ def resize_seam_carving(seam_img: SeamImage, shapes: np.ndarray):
     """
     seam_img.reinit()
 
-    num_vertical_seams, num_horizontal_seams = shapes[0] - shapes[1]
+    num_horizontal_seams, num_vertical_seams = shapes[0] - shapes[1]  # -> shapes are (y,x)
 
     seam_img.seams_removal_vertical(num_vertical_seams)
     seam_img.seams_removal_horizontal(num_horizontal_seams)
@@ -461,34 +823,69 @@ def resize_seam_carving(seam_img: SeamImage, shapes: np.ndarray):
     return seam_img.resized_rgb
 
 
-def bilinear(image, new_shape):
+@functools.lru_cache(maxsize=64)
+def bilinear_tables(in_size, out_size):
+    """ Precomputes the source indices and weights of one axis for bilinear resizing.
+    The tables of both axes are separable, and cached for every (input, output) size pair.
+
+    Parameters:
+        in_size (int): size of the axis in the original image
+        out_size (int): size of the axis in the resized image
+
+    Returns:
+        read-only arrays of shape (out_size,): the lower and upper source indices (int32),
+        and the weight (float64) of the upper one
+    """
+    scaled = np.minimum(np.arange(out_size) * in_size / out_size, in_size - 1)
+    lower = scaled.astype(np.int32)
+    upper = np.minimum(lower + 1, in_size - 1).astype(np.int32)
+    weight = scaled - lower
+    for table in (lower, upper, weight):
+        table.setflags(write=False)
+    return lower, upper, weight
+
+
+@jit(nopython=True, cache=True)
+def bilinear_kernel(image, y1s, y2s, wy, x1s, x2s, wx, out):
+    """ Fills out with the bilinear interpolation of image, one output row at a time
+    """
+    out_height, out_width, channels = out.shape
+    for i in range(out_height):
+        for j in range(out_width):
+            for k in range(channels):
+                top = image[y1s[i], x1s[j], k] * (1 - wx[j]) + image[y1s[i], x2s[j], k] * wx[j]
+                bottom = image[y2s[i], x1s[j], k] * (1 - wx[j]) + image[y2s[i], x2s[j], k] * wx[j]
+                out[i, j, k] = top * (1 - wy[i]) + bottom * wy[i]
+
+
+def bilinear(image, new_shape, out=None, chunk_rows=256, compiled=True):
     """
     Resizes an image to new shape using bilinear interpolation method
     :param image: The original image
     :param new_shape: a (height, width) tuple which is the new shape
+    :param out: an optional preallocated (height, width, channels) buffer to write the result into
+    :param chunk_rows: the number of output rows interpolated at once when compiled is False
+    :param compiled: use the compiled kernel instead of chunked numpy
     :returns: the image resized to new_shape
     """
-    in_height, in_width, _ = image.shape
+    in_height, in_width, channels = image.shape
     out_height, out_width = new_shape
-    new_image = np.zeros(new_shape)
-
-    ###Your code here###
-    def get_scaled_param(org, size_in, size_out):
-        scaled_org = (org * size_in) / size_out
-        scaled_org = min(scaled_org, size_in - 1)
-        return scaled_org
-
-    scaled_x_grid = [get_scaled_param(x, in_width, out_width) for x in range(out_width)]
-    scaled_y_grid = [get_scaled_param(y, in_height, out_height) for y in range(out_height)]
-    x1s = np.array(scaled_x_grid, dtype=int)
-    y1s = np.array(scaled_y_grid, dtype=int)
-    x2s = np.array(scaled_x_grid, dtype=int) + 1
-    x2s[x2s > in_width - 1] = in_width - 1
-    y2s = np.array(scaled_y_grid, dtype=int) + 1
-    y2s[y2s > in_height - 1] = in_height - 1
-    dx = np.reshape(scaled_x_grid - x1s, (out_width, 1))
-    dy = np.reshape(scaled_y_grid - y1s, (out_height, 1))
-    c1 = np.reshape(image[y1s][:, x1s] * dx + (1 - dx) * image[y1s][:, x2s], (out_width, out_height, 3))
-    c2 = np.reshape(image[y2s][:, x1s] * dx + (1 - dx) * image[y2s][:, x2s], (out_width, out_height, 3))
-    new_image = np.reshape(c1 * dy + (1 - dy) * c2, (out_height, out_width, 3)).astype(int)
-    return new_image
+    if out is None:
+        out = np.empty((out_height, out_width, channels), dtype=int)
+
+    y1s, y2s, wy = bilinear_tables(in_height, out_height)
+    x1s, x2s, wx = bilinear_tables(in_width, out_width)
+    if compiled:
+        bilinear_kernel(image, y1s, y2s, wy, x1s, x2s, wx, out)
+        return out
+
+    # -> only chunk_rows rows are gathered at a time, so the temporaries stay small on large images
+    wx = wx[:, None]
+    for i in range(0, out_height, chunk_rows):
+        rows = slice(i, i + chunk_rows)
+        top = image[y1s[rows]]
+        top = top[:, x1s] * (1 - wx) + top[:, x2s] * wx
+        bottom = image[y2s[rows]]
+        bottom = bottom[:, x1s] * (1 - wx) + bottom[:, x2s] * wx
+        out[rows] = top * (1 - wy[rows, None, None]) + bottom * wy[rows, None, None]
+    return out
@@ -34,6 +34,10 @@ class Object3D:
     def calc_specular(self, light_intensity: np.array, direction_to_camera: np.array, reflected_light_direction: np.array) -> np.array:
         return self.specular * light_intensity * (np.power(np.dot(direction_to_camera, reflected_light_direction), self.shininess))
 
+    def bounds(self) -> tuple[np.array, np.array]:
+        """Returns the corners (min, max) of an axis aligned box containing the object. Unbounded by default."""
+        return np.full(3, -np.inf), np.full(3, np.inf)
+
 
 class Ray:
     def __init__(self, origin: np.array, direction: np.array):
@@ -146,6 +150,10 @@ class Triangle(Object3D):
         w = 1 - u - v
 
         return np.array([u, v, w])
+
+    def bounds(self) -> tuple[np.array, np.array]:
+        vertices = np.array([self.a, self.b, self.c])
+        return vertices.min(axis=0), vertices.max(axis=0)
         
 
 class Pyramid(Object3D):
@@ -208,6 +216,10 @@ A /&&&&&&&&&&&&&&&&&&&&\ B &&&/ C
     def compute_normal(self, intersection_point: np.array) -> np.array:
         raise NotImplementedError("This function is not implemented for Pyramid object, use Triangle instead.")
 
+    def bounds(self) -> tuple[np.array, np.array]:
+        vertices = np.array(self.v_list)
+        return vertices.min(axis=0), vertices.max(axis=0)
+
 class Sphere(Object3D):
     def __init__(self, center: np.array, radius: float):
         self.center = center
@@ -241,6 +253,102 @@ class Sphere(Object3D):
     def compute_normal(self, intersection_point: np.array) -> np.array:
         return normalize(intersection_point - self.center)
 
+    def bounds(self) -> tuple[np.array, np.array]:
+        return np.array(self.center) - self.radius, np.array(self.center) + self.radius
+
+
+def transform_matrix(translation: np.array = (0, 0, 0), scale: float = 1, rotation: np.array = np.eye(3)) -> np.array:
+    """This function returns the 4x4 affine matrix that scales, then rotates (by a 3x3 matrix), then translates."""
+    matrix = np.eye(4)
+    matrix[:3, :3] = np.array(rotation) @ (np.eye(3) * scale)
+    matrix[:3, 3] = translation
+    return matrix
+
+
+class Instance(Object3D):
+    """
+    A placement of a shared geometry (any object, e.g. a Pyramid or a Sphere, or a list of objects) in the scene,
+    with its own affine transform and material. The geometry is never copied, so many instances of it cost
+    only a transform, a box and a material each. The material of the geometry itself is not used.
+
+    Rays are transformed into the object space of the geometry to be intersected. The world space box of the
+    instance is computed once, and rays that miss it skip the geometry.
+    """
+    def __init__(self, geometry, matrix: np.array = np.eye(4)):
+        self.geometry = geometry
+        self.matrix = np.array(matrix, dtype=float)
+        self.inverse = np.linalg.inv(self.matrix)
+        self.bounds_min, self.bounds_max = self.compute_bounds()
+        self.is_bounded = np.all(np.isfinite(self.bounds_min)) and np.all(np.isfinite(self.bounds_max))
+
+    def geometry_bounds(self) -> tuple[np.array, np.array]:
+        if isinstance(self.geometry, Object3D):
+            return self.geometry.bounds()
+        bounds = [obj.bounds() for obj in self.geometry]
+        return np.min([b[0] for b in bounds], axis=0), np.max([b[1] for b in bounds], axis=0)
+
+    def compute_bounds(self) -> tuple[np.array, np.array]:
+        """Computes the world space box containing the 8 transformed corners of the geometry's box."""
+        low, high = self.geometry_bounds()
+        if not (np.all(np.isfinite(low)) and np.all(np.isfinite(high))):
+            return np.full(3, -np.inf), np.full(3, np.inf)
+        corners = np.array([[x, y, z] for x in (low[0], high[0]) for y in (low[1], high[1]) for z in (low[2], high[2])])
+        corners = corners @ self.matrix[:3, :3].T + self.matrix[:3, 3]
+        return corners.min(axis=0), corners.max(axis=0)
+
+    def bounds(self) -> tuple[np.array, np.array]:
+        return self.bounds_min, self.bounds_max
+
+    def point_to_object(self, point: np.array) -> np.array:
+        return self.inverse[:3, :3] @ point + self.inverse[:3, 3]
+
+    def normal_to_world(self, normal: np.array) -> np.array:
+        return normalize(self.inverse[:3, :3].T @ normal)
+
+    def hits_bounds(self, ray: Ray) -> bool:
+        """Slab test of the ray against the world space box of the instance."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t1 = (self.bounds_min - ray.origin) / ray.direction
+            t2 = (self.bounds_max - ray.origin) / ray.direction
+        t_near = np.nanmax(np.minimum(t1, t2))
+        t_far = np.nanmin(np.maximum(t1, t2))
+        return t_near <= t_far and t_far > 0
+
+    def intersect(self, ray: Ray) -> tuple[float, Object3D]:
+        if self.is_bounded and not self.hits_bounds(ray):
+            return np.inf, None
+
+        direction = self.inverse[:3, :3] @ ray.direction
+        scale = np.linalg.norm(direction)  # object space distances are this much longer than world space ones
+        object_ray = Ray(self.point_to_object(ray.origin), direction)
+        if isinstance(self.geometry, Object3D):
+            t, primitive = self.geometry.intersect(object_ray)
+        else:
+            t, primitive = object_ray.nearest_intersected_object(self.geometry)
+
+        if primitive is None:
+            return np.inf, None
+        return t / scale, InstanceHit(self, primitive)
+
+    def compute_normal(self, intersection_point: np.array) -> np.array:
+        raise NotImplementedError("This function is not implemented for Instance object, use the InstanceHit returned by intersect instead.")
+
+
+class InstanceHit(Object3D):
+    """The surface hit on an instance: the shared primitive that was hit, with the material and transform of the instance."""
+    def __init__(self, instance: Instance, primitive: Object3D):
+        self.instance = instance
+        self.primitive = primitive
+        self.ambient = instance.ambient
+        self.diffuse = instance.diffuse
+        self.specular = instance.specular
+        self.shininess = instance.shininess
+        self.reflection = instance.reflection
+
+    def compute_normal(self, intersection_point: np.array) -> np.array:
+        object_normal = self.primitive.compute_normal(self.instance.point_to_object(intersection_point))
+        return self.instance.normal_to_world(object_normal)
+
     
 class LightSource:
     def __init__(self, intensity: np.array, color: np.array = np.array([1, 1, 1])):